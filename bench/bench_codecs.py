@@ -0,0 +1,87 @@
+"""
+Compare compression codecs on dump/load throughput and compression ratio.
+
+Usage (from the repository root, with the package importable):
+    python bench/bench_codecs.py [--size-mb 64] [--repeat 3] [--codecs none,gzip,zstd]
+
+Prints one JSON object per codec. Codecs whose optional dependency is not
+installed are reported with an "error" field instead of timings.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from array import array
+
+from model_filer import Filer
+from model_filer.compression import CODECS
+
+
+def make_payload(size_mb):
+    """
+    Build an object resembling a fitted model: a large float table with
+    limited precision (which compresses like real weights do) plus metadata.
+    """
+    n = size_mb * 1024 * 1024 // 8
+    try:
+        import numpy as np
+        weights = np.round(np.random.default_rng(0).normal(size=n), 3)
+    except ImportError:
+        rng = random.Random(0)
+        weights = array('d', (round(rng.gauss(0, 1), 3) for _ in range(n)))
+    return {'weights': weights,
+            'vocabulary': {'token{}'.format(i): i for i in range(10000)},
+            'params': {'alpha': 0.1, 'max_iter': 100}}
+
+
+def bench_codec(codec, payload, repeat):
+    local_dir = tempfile.mkdtemp()
+    remote_dir = tempfile.mkdtemp()
+    try:
+        filer = Filer(local_dir, remote_dir)
+        dump_times, load_times = [], []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            filer.dump(payload, 'model', codec=codec, overwrite=True)
+            dump_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            filer.load('model')
+            load_times.append(time.perf_counter() - start)
+        stored_bytes = os.path.getsize(os.path.join(local_dir, 'model.pkl'))
+    finally:
+        shutil.rmtree(local_dir)
+        shutil.rmtree(remote_dir)
+    return {'stored_bytes': stored_bytes,
+            'dump_seconds': min(dump_times),
+            'load_seconds': min(load_times)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=64)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--codecs', default=','.join(['none'] + list(CODECS)))
+    args = parser.parse_args()
+
+    payload = make_payload(args.size_mb)
+    results = {}
+    for codec in args.codecs.split(','):
+        try:
+            results[codec] = bench_codec(codec, payload, args.repeat)
+        except ImportError as e:
+            results[codec] = {'error': str(e)}
+    raw_bytes = results.get('none', {}).get('stored_bytes')
+    for codec, result in results.items():
+        if 'error' not in result:
+            if raw_bytes:
+                result['ratio'] = raw_bytes / result['stored_bytes']
+                result['dump_mb_per_s'] = raw_bytes / result['dump_seconds'] / 2 ** 20
+                result['load_mb_per_s'] = raw_bytes / result['load_seconds'] / 2 ** 20
+        print(json.dumps(dict(codec=codec, **result)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+"""
+Benchmark the hot paths of the library: dump, load, push, pull and push_all
+across object sizes and remotes, and registry operations across registry
+sizes.
+
+Usage (from the repository root, with the package importable):
+    python bench/bench_filer.py [--sizes 1KB,1MB,64MB] [--registry-sizes 10,1000,100000]
+                                [--remotes drive,s3] [--output results.json]
+                                [--compare baseline.json [--threshold 1.25]]
+
+The S3 remote is benchmarked against an offline stand-in (see fake_s3.py).
+Results are written as JSON. With --compare, each result is matched against
+a previous results file and the script exits with status 1 if any benchmark
+got slower by more than the threshold ratio.
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+from fake_s3 import use_fake_s3
+from model_filer import Filer
+from model_filer.registry import DELIMITER, QUOTECHAR, Registry
+from model_filer.sqlite_registry import SQLiteRegistry
+
+UNITS = {'B': 1, 'KB': 2 ** 10, 'MB': 2 ** 20, 'GB': 2 ** 30}
+BLOCK = os.urandom(2 ** 20)
+
+
+def parse_size(text):
+    text = text.strip().upper()
+    for unit in sorted(UNITS, key=len, reverse=True):
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * UNITS[unit])
+    return int(text)
+
+
+def make_payload(size):
+    """
+    Incompressible bytes of the given size (built from a repeated random
+    block, which is much cheaper than generating GBs of randomness).
+    """
+    blocks, remainder = divmod(size, len(BLOCK))
+    return BLOCK * blocks + BLOCK[:remainder]
+
+
+@contextmanager
+def make_filer(remote, **kwargs):
+    local_dir = tempfile.mkdtemp(prefix='bench_local_')
+    remote_dir = tempfile.mkdtemp(prefix='bench_remote_')
+    try:
+        if remote == 'drive':
+            yield Filer(local_dir, remote_dir, **kwargs)
+        else:
+            yield use_fake_s3(Filer(local_dir, remote_type='s3', **kwargs), remote_dir)
+    finally:
+        shutil.rmtree(local_dir)
+        shutil.rmtree(remote_dir)
+
+
+def timed(func, repeat, setup=None):
+    """
+    Run `func` `repeat` times (calling `setup` untimed before each run) and
+    return the min and median durations.
+    """
+    durations = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return {'seconds_min': min(durations), 'seconds_median': statistics.median(durations)}
+
+
+def bench_transfers(remote, size, repeat, batch_size, max_workers):
+    payload = make_payload(size)
+    results = []
+
+    def record(benchmark, timing, nbytes=size):
+        timing.update(benchmark=benchmark, remote=remote, size_bytes=size)
+        timing['mb_per_s'] = nbytes / timing['seconds_min'] / 2 ** 20
+        results.append(timing)
+
+    with make_filer(remote) as filer:
+        local_file = os.path.join(filer.local_path, 'model.pkl')
+        record('dump', timed(lambda: filer.dump(payload, 'model', overwrite=True), repeat))
+        record('load', timed(lambda: filer.load('model'), repeat))
+
+        def reset_local():
+            if filer.registry.find_by_name('model'):
+                filer.remove('model', remove_remote=True)
+            filer.dump(payload, 'model')
+        record('push', timed(lambda: filer.push('model'), repeat, setup=reset_local))
+        record('pull', timed(lambda: filer.pull('model'), repeat,
+                             setup=lambda: os.remove(local_file)))
+        record('load_cold', timed(lambda: filer.load('model'), repeat,
+                                  setup=lambda: os.remove(local_file)))
+
+    with make_filer(remote, max_workers=max_workers) as filer:
+        def reset_batch():
+            for entry in filer.registry.get_all_entries():
+                filer.remove(entry.name, remove_remote=True)
+            for i in range(batch_size):
+                filer.dump(payload, 'model{}'.format(i))
+        timing = timed(filer.push_all, repeat, setup=reset_batch)
+        timing['batch_size'] = batch_size
+        timing['max_workers'] = max_workers
+        record('push_all', timing, nbytes=size * batch_size)
+    return results
+
+
+def write_registry(path, n_entries):
+    """
+    Write a registry in which one entry in 100 is local, and timestamps are
+    spread over four weeks.
+    """
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f, delimiter=DELIMITER, quotechar=QUOTECHAR)
+        for i in range(n_entries):
+            writer.writerow(['model{}'.format(i), 'local' if i % 100 == 0 else 'synced',
+                             'model{}_address.pkl'.format(i),
+                             '2020-01-{:02d}::00:00:00'.format(i % 28 + 1)])
+
+
+def consume(entries):
+    for _ in entries:
+        pass
+
+
+def bench_registry(n_entries, repeat):
+    directory = tempfile.mkdtemp(prefix='bench_registry_')
+    path = os.path.join(directory, '.drive_registry')
+    middle = 'model{}'.format(n_entries // 2)
+    results = []
+
+    def record(benchmark, timing):
+        timing.update(benchmark=benchmark, registry_entries=n_entries)
+        results.append(timing)
+
+    def bench_queries(registry, label):
+        record(label + '_iter', timed(lambda: consume(registry.iter_entries()), repeat))
+        record(label + '_iter_status', timed(
+            lambda: consume(registry.iter_entries(status='local')), repeat))
+        record(label + '_iter_prefix', timed(
+            lambda: consume(registry.iter_entries(prefix=middle)), repeat))
+        record(label + '_iter_timestamps', timed(
+            lambda: consume(registry.iter_entries(since='2020-01-10::00:00:00',
+                                                  until='2020-01-11::00:00:00')), repeat))
+
+    try:
+        write_registry(path, n_entries)
+        registry = Registry(path)
+        record('registry_cold_lookup', timed(lambda: Registry(path).find_by_name(middle), repeat))
+        record('registry_lookup', timed(lambda: registry.find_by_name(middle), repeat))
+        record('registry_get_all', timed(registry.get_all_entries, repeat))
+        bench_queries(registry, 'registry')
+        tracemalloc.start()
+        Registry(path).find_by_name(middle)
+        results.append({'benchmark': 'registry_index_peak_bytes', 'registry_entries': n_entries,
+                        'peak_bytes': tracemalloc.get_traced_memory()[1]})
+        tracemalloc.stop()
+        record('registry_update', timed(
+            lambda: registry.update_entry(middle, address='new_address.pkl'), repeat))
+
+        def add_new():
+            registry.add_entry('new', 'local', None, '2020-01-01::00:00:00')
+
+        def remove_new():
+            registry.remove_entry('new')
+
+        def ensure_new(present):
+            if present and not registry.find_by_name('new'):
+                add_new()
+            elif not present and registry.find_by_name('new'):
+                remove_new()
+        record('registry_add', timed(add_new, repeat, setup=lambda: ensure_new(False)))
+        record('registry_remove', timed(remove_new, repeat, setup=lambda: ensure_new(True)))
+
+        sqlite_registry = SQLiteRegistry(path + '.sqlite', tsv_file=path)
+        record('sqlite_registry_get_all', timed(sqlite_registry.get_all_entries, repeat))
+        bench_queries(sqlite_registry, 'sqlite_registry')
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+def result_key(result):
+    return (result['benchmark'], result.get('remote'), result.get('size_bytes'),
+            result.get('registry_entries'))
+
+
+def compare(results, baseline_file, threshold):
+    """
+    Print how each result compares to a baseline file. Returns the list of
+    benchmarks that regressed by more than `threshold`.
+    """
+    with open(baseline_file) as f:
+        baseline = {result_key(result): result for result in json.load(f)['results']}
+    regressions = []
+    for result in results:
+        old = baseline.get(result_key(result))
+        if not old:
+            continue
+        # (memory results are compared by their peak instead of their time)
+        metric = 'seconds_min' if 'seconds_min' in result else 'peak_bytes'
+        ratio = result[metric] / old[metric]
+        flag = ''
+        if ratio > threshold:
+            regressions.append(result_key(result))
+            flag = '  REGRESSION'
+        print('{:<60} {:6.2f}x{}'.format(str(result_key(result)), ratio, flag), file=sys.stderr)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='1KB,1MB,64MB')
+    parser.add_argument('--registry-sizes', default='10,1000,100000')
+    parser.add_argument('--remotes', default='drive,s3')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--max-workers', type=int, default=4)
+    parser.add_argument('--output', help='write results to this file instead of stdout')
+    parser.add_argument('--compare', help='results file from a previous run to compare against')
+    parser.add_argument('--threshold', type=float, default=1.25)
+    args = parser.parse_args()
+
+    results = []
+    for remote in args.remotes.split(','):
+        for size in args.sizes.split(','):
+            results.extend(bench_transfers(remote, parse_size(size), args.repeat,
+                                           args.batch_size, args.max_workers))
+    for n_entries in args.registry_sizes.split(','):
+        results.extend(bench_registry(int(n_entries), args.repeat))
+
+    report = {'meta': {'timestamp': datetime.now().isoformat(),
+                       'python': platform.python_version(),
+                       'platform': platform.platform(),
+                       'args': vars(args)},
+              'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
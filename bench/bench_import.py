@@ -0,0 +1,96 @@
+"""
+Benchmark the startup cost of model_filer: the time to import the package
+and to create a filer, each in a fresh interpreter.
+
+Usage (from the repository root, with the package importable):
+    python bench/bench_import.py [--repeat 10] [--max-ms 300] [--output results.json]
+
+Import times come from `python -X importtime`, which also gives the modules
+that take the longest. With `--max-ms`, the script exits with an error if
+importing model_filer takes longer than that, or if it imports any of the
+heavy dependencies that should only be imported when they are used (boto3,
+numpy), so it can guard startup cost in CI.
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+
+# Dependencies that `import model_filer` must not import
+LAZY_MODULES = ('boto3', 'botocore', 'numpy')
+
+CREATE_FILER = """
+import tempfile
+from model_filer import Filer
+Filer(tempfile.mkdtemp(), remote_type='s3')
+"""
+
+
+def import_times(code):
+    """
+    Run `code` in a fresh interpreter under `-X importtime`, and return a dict
+    mapping each imported module to its (self, cumulative) time in seconds.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        times[module.strip()] = (int(self_us) / 1e6, int(cumulative_us) / 1e6)
+    return times
+
+
+def bench(name, code, repeat, top):
+    runs = [import_times(code) for _ in range(repeat)]
+    totals = [sum(self_time for self_time, _ in times.values()) for times in runs]
+    package = [times['model_filer'][1] for times in runs]
+    slowest = sorted(runs[-1].items(), key=lambda item: item[1][0], reverse=True)[:top]
+    return {'benchmark': name,
+            'seconds_min': min(totals), 'seconds_median': statistics.median(totals),
+            'model_filer_seconds_min': min(package),
+            'lazy_modules_imported': [module for module in LAZY_MODULES if module in runs[-1]],
+            'slowest_modules': [{'module': module, 'self_seconds': self_time}
+                                for module, (self_time, _) in slowest]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--top', type=int, default=10,
+                        help='number of slowest modules to report')
+    parser.add_argument('--max-ms', type=float,
+                        help='fail if importing model_filer takes longer than this')
+    parser.add_argument('--output', help='write results to this file instead of stdout')
+    args = parser.parse_args()
+
+    results = [bench('import', 'import model_filer', args.repeat, args.top),
+               bench('create_s3_filer', CREATE_FILER, args.repeat, args.top)]
+
+    report = {'meta': {'timestamp': datetime.now().isoformat(),
+                       'python': platform.python_version(),
+                       'platform': platform.platform(),
+                       'args': vars(args)},
+              'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.max_ms is not None:
+        import_result = results[0]
+        if import_result['model_filer_seconds_min'] * 1000 > args.max_ms:
+            sys.exit("Importing model_filer took {:.0f}ms (limit {:.0f}ms)".format(
+                import_result['model_filer_seconds_min'] * 1000, args.max_ms))
+        if import_result['lazy_modules_imported']:
+            sys.exit("Importing model_filer imported {}".format(
+                ', '.join(import_result['lazy_modules_imported'])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark the S3 transfer layer: the cost of constructing S3-backed filers
+with and without the shared client pool, and pull throughput for a large
+model across transfer settings.
+
+Usage (from the repository root, with the package importable):
+    python bench/bench_s3.py [--size 256MB] [--concurrency 1,4,8,16] [--part-size 8MB]
+                             [--latency 0.02] [--bandwidth 50MB] [--output results.json]
+
+Transfers run against the offline stand-in in fake_s3.py, with a simulated
+per-request latency and per-connection bandwidth, so no credentials are
+needed. Results are written as JSON, one entry per benchmark.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import tempfile
+from datetime import datetime
+
+import boto3
+
+from bench_filer import make_payload, parse_size, timed
+from fake_s3 import use_fake_s3
+from model_filer import Filer
+
+
+def bench_construction(repeat):
+    """
+    Time creating an S3-backed filer and fetching its client (which reuses
+    the pooled one) against creating a fresh boto3 client, as every filer
+    used to. The client is fetched explicitly, since the remote only asks
+    for one when it is first used.
+    """
+    local_dir = tempfile.mkdtemp(prefix='bench_local_')
+    try:
+        Filer(local_dir, remote_type='s3').remote.s3_client
+        return [
+            dict(timed(lambda: boto3.client('s3'), repeat), benchmark='s3_fresh_client'),
+            dict(timed(lambda: Filer(local_dir, remote_type='s3').remote.s3_client, repeat),
+                 benchmark='s3_filer_construction'),
+        ]
+    finally:
+        shutil.rmtree(local_dir)
+
+
+def bench_pull(size, concurrency, part_size, latency, bandwidth, repeat):
+    local_dir = tempfile.mkdtemp(prefix='bench_local_')
+    remote_dir = tempfile.mkdtemp(prefix='bench_remote_')
+    transfer_config = {'max_concurrency': concurrency, 'multipart_chunksize': part_size}
+    try:
+        filer = use_fake_s3(Filer(local_dir, remote_type='s3',
+                                  remote_options={'transfer_config': transfer_config}),
+                            remote_dir, latency=latency, bandwidth=bandwidth)
+        filer.dump(make_payload(size), 'model', push=True)
+        local_file = os.path.join(local_dir, 'model.pkl')
+        timing = timed(lambda: filer.pull('model'), repeat, setup=lambda: os.remove(local_file))
+        timing.update(benchmark='s3_pull', size_bytes=size, max_concurrency=concurrency,
+                      part_size=part_size)
+        timing['mb_per_s'] = size / timing['seconds_min'] / 2 ** 20
+        return timing
+    finally:
+        shutil.rmtree(local_dir)
+        shutil.rmtree(remote_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', default='256MB')
+    parser.add_argument('--concurrency', default='1,4,8,16')
+    parser.add_argument('--part-size', default='8MB')
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='simulated seconds per request')
+    parser.add_argument('--bandwidth', default='50MB',
+                        help='simulated bytes per second per connection')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='write results to this file instead of stdout')
+    args = parser.parse_args()
+
+    results = bench_construction(max(args.repeat, 10))
+    for concurrency in args.concurrency.split(','):
+        results.append(bench_pull(parse_size(args.size), int(concurrency),
+                                  parse_size(args.part_size), args.latency,
+                                  parse_size(args.bandwidth), args.repeat))
+
+    report = {'meta': {'timestamp': datetime.now().isoformat(),
+                       'python': platform.python_version(),
+                       'platform': platform.platform(),
+                       'args': vars(args)},
+              'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+"""
+An offline stand-in for the parts of the boto3 S3 client used by `S3Remote`.
+
+Objects are stored as files in a local directory, so benchmarks exercise the
+same code paths as against a real bucket without needing credentials or
+leaving anything behind. Install it on a filer with `use_fake_s3(filer, path)`.
+
+To make transfer settings visible in benchmarks, each request can be given a
+fixed `latency` and each connection a `bandwidth` cap (in bytes per second),
+as a real object store would have.
+"""
+import hashlib
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+from uuid import uuid4
+
+from botocore.exceptions import ClientError
+
+
+def _error(code, operation):
+    return ClientError({'Error': {'Code': code, 'Message': code}}, operation)
+
+
+class _Body():
+    def __init__(self, path, start, end, bandwidth=None):
+        self._f = open(path, 'rb')
+        self._f.seek(start)
+        self._remaining = end - start
+        self._bandwidth = bandwidth
+
+    def read(self, amt=None):
+        if amt is None or amt > self._remaining:
+            amt = self._remaining
+        if not amt:
+            self._f.close()
+            return b''
+        data = self._f.read(amt)
+        self._remaining -= len(data)
+        if self._bandwidth:
+            time.sleep(len(data) / self._bandwidth)
+        return data
+
+    def iter_chunks(self, chunk_size=1024 * 1024):
+        for chunk in iter(lambda: self.read(chunk_size), b''):
+            yield chunk
+
+    def close(self):
+        self._f.close()
+
+
+class FakeS3Client():
+    def __init__(self, path, latency=0.0, bandwidth=None):
+        self.path = path
+        self.latency = latency
+        self.bandwidth = bandwidth
+
+    def _object_path(self, Bucket, Key):
+        return os.path.join(self.path, Bucket, Key)
+
+    def _etag(self, path):
+        stat = os.stat(path)
+        return '"{}"'.format(hashlib.md5('{}:{}'.format(stat.st_size, stat.st_mtime_ns).encode()).hexdigest())
+
+    def upload_file(self, Filename, Bucket, Key, Config=None, ExtraArgs=None):
+        path = self._object_path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        time.sleep(self.latency)
+        shutil.copyfile(Filename, path)
+        if self.bandwidth:
+            # (as for a single-part upload; parts are not simulated)
+            time.sleep(os.path.getsize(path) / self.bandwidth)
+
+    def put_object(self, Bucket, Key, Body):
+        path = self._object_path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        time.sleep(self.latency)
+        with open(path, 'wb') as f:
+            f.write(Body)
+        return {'ETag': self._etag(path)}
+
+    def _upload_path(self, UploadId, PartNumber=None):
+        path = os.path.join(self.path, '.uploads', UploadId)
+        return path if PartNumber is None else os.path.join(path, str(PartNumber))
+
+    def create_multipart_upload(self, Bucket, Key):
+        upload_id = str(uuid4())
+        os.makedirs(self._upload_path(upload_id))
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, PartNumber, UploadId, Body):
+        time.sleep(self.latency)
+        if self.bandwidth:
+            time.sleep(len(Body) / self.bandwidth)
+        with open(self._upload_path(UploadId, PartNumber), 'wb') as f:
+            f.write(Body)
+        return {'ETag': '"{}"'.format(hashlib.md5(Body).hexdigest())}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        path = self._object_path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            for part in MultipartUpload['Parts']:
+                with open(self._upload_path(UploadId, part['PartNumber']), 'rb') as src:
+                    shutil.copyfileobj(src, f)
+        shutil.rmtree(self._upload_path(UploadId))
+        return {}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        shutil.rmtree(self._upload_path(UploadId))
+        return {}
+
+    def copy(self, CopySource, Bucket, Key, Config=None):
+        path = self._object_path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(self._object_path(CopySource['Bucket'], CopySource['Key']), path)
+
+    def head_object(self, Bucket, Key):
+        time.sleep(self.latency)
+        path = self._object_path(Bucket, Key)
+        if not os.path.isfile(path):
+            raise _error('404', 'HeadObject')
+        return {'ContentLength': os.path.getsize(path), 'ETag': self._etag(path)}
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None):
+        time.sleep(self.latency)
+        path = self._object_path(Bucket, Key)
+        if not os.path.isfile(path):
+            raise _error('NoSuchKey', 'GetObject')
+        if IfMatch is not None and IfMatch != self._etag(path):
+            raise _error('PreconditionFailed', 'GetObject')
+        size = os.path.getsize(path)
+        start, end = 0, size
+        if Range:
+            first, _, last = Range[len('bytes='):].partition('-')
+            start = int(first)
+            if last:
+                end = min(int(last) + 1, size)
+        return {'Body': _Body(path, start, end, self.bandwidth), 'ContentLength': end - start,
+                'ETag': self._etag(path)}
+
+    def delete_object(self, Bucket, Key):
+        path = self._object_path(Bucket, Key)
+        if os.path.isfile(path):
+            os.remove(path)
+        return {}
+
+    def list_objects_v2(self, Bucket, Prefix='', ContinuationToken=None, MaxKeys=1000):
+        time.sleep(self.latency)
+        root = os.path.join(self.path, Bucket)
+        keys = sorted(os.path.relpath(os.path.join(directory, filename), root)
+                      for directory, _, filenames in os.walk(root) for filename in filenames)
+        keys = [key for key in keys if key.startswith(Prefix) and key > (ContinuationToken or '')]
+        contents = [{'Key': key, 'Size': os.path.getsize(self._object_path(Bucket, key)),
+                     'LastModified': datetime.fromtimestamp(
+                         os.path.getmtime(self._object_path(Bucket, key)), timezone.utc)}
+                    for key in keys[:MaxKeys]]
+        response = {'Contents': contents, 'IsTruncated': len(keys) > MaxKeys}
+        if response['IsTruncated']:
+            response['NextContinuationToken'] = contents[-1]['Key']
+        return response
+
+    def delete_objects(self, Bucket, Delete):
+        time.sleep(self.latency)
+        assert len(Delete['Objects']) <= 1000
+        for obj in Delete['Objects']:
+            path = self._object_path(Bucket, obj['Key'])
+            if os.path.isfile(path):
+                os.remove(path)
+        return {}
+
+
+def use_fake_s3(filer, path, **kwargs):
+    """
+    Point an S3-backed filer at a `FakeS3Client` storing objects under `path`.
+    """
+    filer.remote.s3_client = FakeS3Client(path, **kwargs)
+    return filer
@@ -1 +1,13 @@
 from .filer import *
+from .cache import ObjectCache
+from .metrics import MetricsAggregator
+from .aio import AsyncFiler
+from .remotes import DriveRemote, register_remote_type
+
+
+def __getattr__(name):
+    # (S3Remote is imported on first access, as in `remotes`)
+    if name == 'S3Remote':
+        from .remotes import S3Remote
+        return S3Remote
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
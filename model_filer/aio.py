@@ -0,0 +1,119 @@
+"""
+An asyncio interface to `Filer`.
+
+The blocking work of each call (registry access, transfers and pickling) runs
+in an executor, so the event loop stays responsive while a large model is
+downloaded and unpickled.
+"""
+import asyncio
+import functools
+
+from .filer import TransferError
+
+
+class AsyncFiler():
+    """
+    Wrap a `Filer` with coroutine versions of its transfer methods.
+
+    Concurrent calls for the same name share a single operation: if twenty
+    requests `aload('my_model')` at once, the file is downloaded and unpickled
+    once and all of them receive the same object. Cancelling one caller does
+    not cancel the shared operation for the others.
+
+    Parameters
+    ----------
+    filer : Filer
+        The filer to wrap. It can still be used directly.
+    executor : concurrent.futures.Executor or None (default None)
+        Executor to run blocking work in, or None for the event loop's
+        default executor.
+
+    Example
+    -------
+    >>> afiler = AsyncFiler(Filer(local_dir, remote_address, remote_type='s3'))
+    >>> model = await afiler.aload('my_model')
+    """
+    def __init__(self, filer, executor=None):
+        self.filer = filer
+        self.executor = executor
+        self._in_flight = {}
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    def _single_flight(self, key, func, *args):
+        """
+        Run `func(*args)` in the executor unless a call with the same key is
+        already running, and return an awaitable for its result.
+        """
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._run(func, *args))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return asyncio.shield(task)
+
+    async def aload(self, name):
+        """
+        Coroutine version of `Filer.load`.
+        """
+        return await self._single_flight(('load', name), self.filer.load, name)
+
+    async def apull(self, name):
+        """
+        Coroutine version of `Filer.pull`.
+        """
+        return await self._single_flight(('pull', name), self.filer.pull, name)
+
+    async def apush(self, name):
+        """
+        Coroutine version of `Filer.push`.
+        """
+        return await self._single_flight(('push', name), self.filer.push, name)
+
+    async def _gather(self, func, names, max_workers):
+        """
+        Call `func(name)` for every name with at most `max_workers` running at
+        once. Returns dicts of results and of exceptions, like
+        `Filer._run_batch`.
+        """
+        if max_workers is None:
+            max_workers = self.filer.max_workers
+        semaphore = asyncio.Semaphore(max(1, max_workers))
+
+        async def run(name):
+            async with semaphore:
+                return await func(name)
+        outcomes = await asyncio.gather(*[run(name) for name in names], return_exceptions=True)
+        results, errors = {}, {}
+        for name, outcome in zip(names, outcomes):
+            if isinstance(outcome, Exception):
+                errors[name] = outcome
+            elif isinstance(outcome, BaseException):
+                raise outcome
+            else:
+                results[name] = outcome
+        return results, errors
+
+    async def apush_all(self, max_workers=None):
+        """
+        Coroutine version of `Filer.push_all`.
+        """
+        entries = await self._run(self.filer.registry.find_by_status, 'local')
+
+        async def upload(name):
+            return await self._single_flight(('upload', name), self.filer._upload, name)
+        changes, errors = await self._gather(upload, [entry.name for entry in entries],
+                                             max_workers)
+        await self._run(self.filer.registry.update_entries, changes)
+        if errors:
+            raise TransferError(errors)
+
+    async def apull_many(self, names, max_workers=None):
+        """
+        Coroutine version of `Filer.pull_many`.
+        """
+        _, errors = await self._gather(self.apull, list(names), max_workers)
+        if errors:
+            raise TransferError(errors)
@@ -0,0 +1,105 @@
+"""
+Out-of-band storage of large buffers using pickle protocol 5.
+
+Large contiguous buffers (e.g. the data of numpy arrays) are written to a
+sidecar file next to the pickle instead of inline, each aligned so it can be
+used in place. Loading memory-maps the sidecar and hands the unpickler views
+into the map, so arrays are rebuilt without copying and processes loading the
+same file share the page cache.
+
+Sidecar layout:
+    [buffer 0][padding][buffer 1][padding]...[index][index length][magic]
+where the index is a JSON list of [offset, length] pairs.
+"""
+import json
+import mmap
+import struct
+
+import dill
+
+BUFFER_EXTENSION = '.buf'
+ALIGNMENT = 64
+MIN_BUFFER_SIZE = 64 * 1024
+
+_MAGIC = b'MFBUF001'
+_FOOTER = struct.Struct('<Q8s')
+
+
+class BufferWriter():
+    """
+    Buffer callback for a protocol 5 pickler that writes buffers of at least
+    `min_size` bytes to `fileobj` and leaves smaller ones in-band.
+    `close` must be called once pickling is done to write the index.
+    """
+    def __init__(self, fileobj, min_size=MIN_BUFFER_SIZE, alignment=ALIGNMENT):
+        self.fileobj = fileobj
+        self.min_size = min_size
+        self.alignment = alignment
+        self.index = []
+        self._offset = 0
+
+    def __call__(self, pickle_buffer):
+        try:
+            view = pickle_buffer.raw()
+        except BufferError:
+            # non-contiguous buffers can only be stored in-band
+            return True
+        if view.nbytes < self.min_size:
+            return True
+        padding = -self._offset % self.alignment
+        self.fileobj.write(b'\0' * padding)
+        self._offset += padding
+        self.fileobj.write(view)
+        self.index.append([self._offset, view.nbytes])
+        self._offset += view.nbytes
+        return False
+
+    def close(self):
+        index = json.dumps(self.index).encode()
+        self.fileobj.write(index)
+        self.fileobj.write(_FOOTER.pack(len(index), _MAGIC))
+
+
+class OutOfBandPickler(dill.Pickler):
+    """
+    A dill pickler that lets plain numpy arrays reduce themselves with
+    protocol 5, so their data reaches the buffer callback. (dill otherwise
+    pickles every array through `__reduce__`, which keeps the data in-band.)
+    """
+    def save(self, obj, save_persistent_id=True):
+        obj_type = type(obj)
+        if (obj_type.__name__ == 'ndarray' and obj_type.__module__ == 'numpy'
+                and id(obj) not in self.memo):
+            self.framer.commit_frame()
+            self.save_reduce(*obj.__reduce_ex__(self.proto), obj=obj)
+            return
+        dill.Pickler.save(self, obj, save_persistent_id)
+
+
+def dump(obj, fileobj, buffer_fileobj, min_size=MIN_BUFFER_SIZE):
+    """
+    Pickle `obj` to `fileobj`, writing its large buffers to `buffer_fileobj`.
+    """
+    writer = BufferWriter(buffer_fileobj, min_size=min_size)
+    OutOfBandPickler(fileobj, protocol=5, buffer_callback=writer).dump(obj)
+    writer.close()
+
+
+def open_buffers(path, copy_on_write=False):
+    """
+    Memory-map a sidecar file and return views of the buffers it holds, in
+    the order the unpickler expects them.
+
+    The views are read-only unless `copy_on_write` is True, in which case
+    writes go to private copies of the touched pages.
+    """
+    with open(path, 'rb') as f:
+        access = mmap.ACCESS_COPY if copy_on_write else mmap.ACCESS_READ
+        mapped = mmap.mmap(f.fileno(), 0, access=access)
+    view = memoryview(mapped)
+    index_length, magic = _FOOTER.unpack(view[-_FOOTER.size:])
+    if magic != _MAGIC:
+        raise ValueError("'{}' is not a buffer file".format(path))
+    index_end = len(view) - _FOOTER.size
+    index = json.loads(bytes(view[index_end - index_length:index_end]))
+    return [view[offset:offset + length] for offset, length in index]
@@ -0,0 +1,74 @@
+import threading
+from collections import OrderedDict
+
+
+class ObjectCache():
+    """
+    Thread-safe LRU cache of loaded objects, bounded by an approximate budget
+    in bytes.
+
+    Each object is stored under a key together with a version. A lookup only
+    hits if the version matches, so a changed registry entry is never served
+    stale. The size of an object is approximated by the size of its pickle.
+    Cached objects are shared between callers, so they should be treated as
+    read-only.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Total approximate size of the objects kept in the cache. Objects
+        larger than this are never cached.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()  # key -> (version, obj, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, version, default=None):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[0] != version:
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key, version, obj, size):
+        with self._lock:
+            self._discard(key)
+            if size > self.max_bytes:
+                return
+            self._items[key] = (version, obj, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._items.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def _discard(self, key):
+        item = self._items.pop(key, None)
+        if item is not None:
+            self._bytes -= item[2]
+
+    def stats(self):
+        """
+        Return a dict of hit/miss/eviction counts and current usage.
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'items': len(self._items),
+                    'bytes': self._bytes, 'max_bytes': self.max_bytes}
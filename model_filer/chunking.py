@@ -0,0 +1,153 @@
+"""
+Content-defined chunking, for storing successive versions of a file so that
+they share the chunks they have in common.
+
+A file is cut wherever a rolling hash of the last `WINDOW` bytes has its low
+bits all zero, so boundaries depend only on nearby content: an edit moves
+the boundaries around it, but the chunks elsewhere come out the same as
+before. Chunks are named by their digest, and a file is described by a
+manifest listing its chunks in order.
+
+The rolling hash is computed with numpy when it is installed (imported on
+first use, since it is slow to import), and with a much slower pure Python
+loop otherwise. Both find the same boundaries.
+"""
+import bisect
+import hashlib
+import json
+import os
+import random
+
+from .fileio import DEFAULT_ALGORITHM, format_digest
+
+CHUNK_EXTENSION = '.chunk'
+MANIFEST_EXTENSION = '.chunks'
+WINDOW = 64
+AVERAGE_SIZE = 2 ** 20
+MIN_SIZE = 2 ** 18
+MAX_SIZE = 2 ** 22
+BLOCK_SIZE = 4 * 2 ** 20
+
+# (fixed, so that every machine cuts the same file the same way)
+_random = random.Random(0x6d6f64656c)
+_TABLE = [_random.getrandbits(32) for _ in range(256)]
+_np_table = None
+
+
+def _numpy_table():
+    """
+    Return `_TABLE` as a numpy array, or False if numpy is not installed.
+    """
+    global _np_table
+    if _np_table is None:
+        try:
+            import numpy as np
+        except ImportError:
+            _np_table = False
+        else:
+            _np_table = np.array(_TABLE, dtype=np.uint32)
+    return _np_table
+
+
+def _boundary_hits(data, skip, mask):
+    """
+    Return the positions `i >= skip` in `data` at which the hash of the
+    window ending at `i` has none of the bits of `mask` set.
+    """
+    table = _numpy_table()
+    if table is not False:
+        import numpy as np
+        sums = np.cumsum(table[np.frombuffer(data, dtype=np.uint8)], dtype=np.uint32)
+        windows = sums[WINDOW:] - sums[:-WINDOW]
+        hits = np.flatnonzero((windows & mask) == 0) + WINDOW
+        return hits[hits >= skip].tolist()
+    hits = []
+    rolling = 0
+    for i, byte in enumerate(data):
+        rolling += _TABLE[byte]
+        if i >= WINDOW:
+            rolling -= _TABLE[data[i - WINDOW]]
+            if i >= skip and not rolling & mask:
+                hits.append(i)
+    return hits
+
+
+def iter_chunks(fileobj, average_size=AVERAGE_SIZE, min_size=MIN_SIZE, max_size=MAX_SIZE):
+    """
+    Split a binary stream into content-defined chunks, yielding the bytes of
+    each. `average_size` must be a power of two. At most about `max_size` plus
+    `BLOCK_SIZE` bytes are held in memory.
+    """
+    mask = average_size - 1
+    pending = bytearray()  # bytes read since the last cut
+    offset = 0  # position of the last cut
+    tail = b''
+    while True:
+        block = fileobj.read(BLOCK_SIZE)
+        if not block:
+            break
+        data = tail + block
+        start = offset + len(pending) - len(tail)
+        cuts = [start + i + 1 for i in _boundary_hits(data, len(tail), mask)]
+        pending += block
+        tail = data[-WINDOW:]
+        end = offset + len(pending)
+        while True:
+            k = bisect.bisect_left(cuts, offset + min_size)
+            if k < len(cuts) and cuts[k] <= offset + max_size:
+                cut = cuts[k]
+            elif offset + max_size <= end:
+                cut = offset + max_size
+            else:
+                break
+            yield bytes(pending[:cut - offset])
+            del pending[:cut - offset]
+            offset = cut
+    if pending:
+        yield bytes(pending)
+
+
+def chunk_digest(data):
+    return format_digest(hashlib.new(DEFAULT_ALGORITHM, data))
+
+
+def write_manifest(path, chunks):
+    """
+    Write a manifest listing `chunks`, a list of (digest, size) pairs.
+    """
+    with open(path, 'w') as f:
+        json.dump({'chunks': [list(chunk) for chunk in chunks]}, f)
+
+
+def read_manifest(path):
+    with open(path) as f:
+        return [tuple(chunk) for chunk in json.load(f)['chunks']]
+
+
+class ChunkStore():
+    """
+    A directory of chunks named by their digest.
+
+    It only serves to avoid downloading chunks again, so it can be deleted at
+    any time, and its chunks are evicted before any other local file.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def chunk_path(self, digest):
+        return os.path.join(self.path, digest.replace(':', '_') + CHUNK_EXTENSION)
+
+    def __contains__(self, digest):
+        return os.path.isfile(self.chunk_path(digest))
+
+    def usage(self):
+        """
+        Return (last access time, size, path) for each chunk in the store.
+        """
+        try:
+            with os.scandir(self.path) as files:
+                chunk_files = [f for f in files if f.name.endswith(CHUNK_EXTENSION)]
+                stats = [(f.stat(), f.path) for f in chunk_files]
+        except FileNotFoundError:
+            return []
+        return [(stat.st_atime_ns, stat.st_size, path) for stat, path in stats]
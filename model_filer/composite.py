@@ -0,0 +1,61 @@
+"""
+Composite objects stored as separate shards.
+"""
+import threading
+from collections.abc import Mapping
+
+
+class Composite(Mapping):
+    """
+    Read-only mapping returned by `Filer.load` for a sharded dump.
+
+    Each component is pulled and unpickled the first time it is accessed,
+    and kept for later accesses unless `keep` is False. Checking for a key,
+    iterating over keys and `len` never load anything.
+
+    Parameters
+    ----------
+    keys : list
+        The keys of the components, in order.
+    load_component : callable
+        Called with the index of a component to load it.
+    keep : boolean (default True)
+        If False, components are loaded again on each access, e.g. because
+        `load_component` looks them up in a cache of its own.
+    """
+    def __init__(self, keys, load_component, keep=True):
+        self._load_component = load_component
+        self._keep = keep
+        self._indexes = {key: index for index, key in enumerate(keys)}
+        self._components = {}
+        self._loaded = set()
+        self._locks = {key: threading.Lock() for key in keys}
+
+    def __getitem__(self, key):
+        index = self._indexes[key]
+        with self._locks[key]:
+            if key in self._components:
+                return self._components[key]
+            component = self._load_component(index)
+            self._loaded.add(key)
+            if self._keep:
+                self._components[key] = component
+            return component
+
+    def __contains__(self, key):
+        return key in self._indexes
+
+    def __iter__(self):
+        return iter(self._indexes)
+
+    def __len__(self):
+        return len(self._indexes)
+
+    def __repr__(self):
+        return 'Composite({})'.format(list(self._indexes))
+
+    def loaded_keys(self):
+        """
+        Return the keys of the components loaded so far.
+        """
+        return [key for key in self._indexes if key in self._loaded]
@@ -0,0 +1,103 @@
+"""
+A codec compresses bytes as they are written to a file object and
+decompresses them as they are read back, so that pickles never have to be
+buffered whole in memory. Each should have an identical API.
+
+Only `gzip`, `bz2` and `lzma` come with the standard library. The `zstd` and
+`lz4` codecs need the `zstandard` and `lz4` packages respectively, which are
+imported the first time the codec is used.
+"""
+import bz2
+import gzip
+import io
+import lzma
+
+
+class GzipCodec():
+    name = 'gzip'
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def open_writer(self, fileobj):
+        return gzip.GzipFile(fileobj=fileobj, mode='wb', compresslevel=self.level)
+
+    def open_reader(self, fileobj):
+        return gzip.GzipFile(fileobj=fileobj, mode='rb')
+
+
+class Bz2Codec():
+    name = 'bz2'
+
+    def __init__(self, level=9):
+        self.level = level
+
+    def open_writer(self, fileobj):
+        return bz2.BZ2File(fileobj, mode='wb', compresslevel=self.level)
+
+    def open_reader(self, fileobj):
+        return bz2.BZ2File(fileobj, mode='rb')
+
+
+class LzmaCodec():
+    name = 'lzma'
+
+    def __init__(self, preset=6):
+        self.preset = preset
+
+    def open_writer(self, fileobj):
+        return lzma.LZMAFile(fileobj, mode='wb', preset=self.preset)
+
+    def open_reader(self, fileobj):
+        return lzma.LZMAFile(fileobj, mode='rb')
+
+
+class ZstdCodec():
+    name = 'zstd'
+
+    def __init__(self, level=3, threads=0):
+        self.level = level
+        self.threads = threads
+
+    def open_writer(self, fileobj):
+        import zstandard
+        compressor = zstandard.ZstdCompressor(level=self.level, threads=self.threads)
+        return compressor.stream_writer(fileobj, closefd=False)
+
+    def open_reader(self, fileobj):
+        import zstandard
+        reader = zstandard.ZstdDecompressor().stream_reader(fileobj, closefd=False)
+        # pickle needs readline(), which the raw zstd reader does not provide
+        return io.BufferedReader(reader)
+
+
+class Lz4Codec():
+    name = 'lz4'
+
+    def __init__(self, level=0):
+        self.level = level
+
+    def open_writer(self, fileobj):
+        import lz4.frame
+        return lz4.frame.LZ4FrameFile(fileobj, mode='wb', compression_level=self.level)
+
+    def open_reader(self, fileobj):
+        import lz4.frame
+        return lz4.frame.LZ4FrameFile(fileobj, mode='rb')
+
+
+CODECS = {codec.name: codec for codec in (GzipCodec, Bz2Codec, LzmaCodec, ZstdCodec, Lz4Codec)}
+
+
+def get_codec(codec):
+    """
+    Look up a codec by name. Codec objects are passed through unchanged, and
+    None or 'none' (no compression) are returned as None.
+    """
+    if codec is None or codec == 'none':
+        return None
+    if not isinstance(codec, str):
+        return codec
+    if codec not in CODECS:
+        raise ValueError("Unsupported codec: {}".format(codec))
+    return CODECS[codec]()
@@ -0,0 +1,292 @@
+"""
+Helpers for hashing files as they are streamed to and from disk, for
+remembering the digests of files, for writing files atomically, and for
+locking files between processes.
+
+Digests are stored as strings of the form '<algorithm>:<hexdigest>' so that
+the algorithm travels with the value. Besides those of `hashlib`, the
+non-cryptographic 'xxh3_64', 'xxh3_128' and 'xxh64' algorithms (with xxhash
+installed) and 'blake3' (with blake3 installed) can be used; they hash
+several times faster.
+"""
+import hashlib
+import importlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from uuid import uuid4
+
+try:
+    import fcntl
+except ImportError:  # (not available on Windows)
+    fcntl = None
+
+DEFAULT_ALGORITHM = 'sha256'
+CHUNK_SIZE = 1024 * 1024
+PART_EXTENSION = '.part'
+
+# Algorithms provided by optional packages, and the package providing each
+_OPTIONAL_ALGORITHMS = {'xxh3_64': 'xxhash', 'xxh3_128': 'xxhash', 'xxh64': 'xxhash',
+                        'blake3': 'blake3'}
+
+
+class DigestMismatchError(ValueError):
+    """
+    Raised when the contents of a file do not match its recorded digest.
+    """
+
+
+class _NamedHash():
+    """
+    Give a hash object from another package the `name` of its algorithm, as a
+    `hashlib` one has.
+    """
+    def __init__(self, name, file_hash):
+        self.name = name
+        self._hash = file_hash
+
+    def update(self, data):
+        self._hash.update(data)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+
+def new_hash(algorithm=DEFAULT_ALGORITHM):
+    """
+    Return a new hash object for `algorithm`.
+    """
+    package = _OPTIONAL_ALGORITHMS.get(algorithm)
+    if package is None:
+        return hashlib.new(algorithm)
+    try:
+        module = importlib.import_module(package)
+    except ImportError:
+        raise ImportError("The '{}' digest algorithm requires the '{}' package".format(
+            algorithm, package))
+    return _NamedHash(algorithm, getattr(module, algorithm)())
+
+
+class HashingWriter():
+    """
+    Wrap a binary file object so that every byte written through it is hashed.
+
+    Parameters
+    ----------
+    fileobj : file object
+        The underlying file, opened for binary writing. It is not closed when
+        the writer is closed.
+    algorithm : string
+        Name of a digest algorithm.
+    """
+    def __init__(self, fileobj, algorithm=DEFAULT_ALGORITHM):
+        self.fileobj = fileobj
+        self.algorithm = algorithm
+        self._hash = new_hash(algorithm)
+        self.bytes_written = 0
+
+    def write(self, data):
+        self._hash.update(data)
+        self.bytes_written += len(data)
+        return self.fileobj.write(data)
+
+    def flush(self):
+        self.fileobj.flush()
+
+    def writable(self):
+        return True
+
+    def readable(self):
+        return False
+
+    def seekable(self):
+        return False
+
+    def close(self):
+        pass
+
+    @property
+    def closed(self):
+        return self.fileobj.closed
+
+    def digest(self):
+        return format_digest(self._hash)
+
+
+def format_digest(file_hash):
+    """
+    Format a hash object as a digest string.
+    """
+    return '{}:{}'.format(file_hash.name, file_hash.hexdigest())
+
+
+def split_digest(digest):
+    """
+    Split a digest string into its algorithm and hex value.
+    """
+    algorithm, _, value = digest.partition(':')
+    return algorithm, value
+
+
+def combine_digests(digests):
+    """
+    Combine the digests of several files into one digest for the group.
+    """
+    algorithm = split_digest(digests[0])[0]
+    combined = new_hash(algorithm)
+    for digest in digests:
+        combined.update(digest.encode())
+    return format_digest(combined)
+
+
+def file_digest(path, algorithm=DEFAULT_ALGORITHM):
+    """
+    Hash a file on disk in fixed-size chunks.
+    """
+    file_hash, _ = hash_partial_file(path, algorithm)
+    return format_digest(file_hash)
+
+
+def hash_partial_file(path, algorithm=DEFAULT_ALGORITHM):
+    """
+    Hash whatever is already in a (possibly partially downloaded) file.
+
+    Returns the hash object, ready to be updated with the rest of the file,
+    and the number of bytes hashed. A missing file counts as empty.
+    """
+    file_hash = new_hash(algorithm)
+    size = 0
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                file_hash.update(chunk)
+                size += len(chunk)
+    return file_hash, size
+
+
+class DigestCache():
+    """
+    Remembers the digests of files, so that a file is only hashed again once
+    its inode, size or modification time changes.
+
+    Entries are appended to `cache_file`, so the cache outlives the process
+    and is shared by every process using the file. Later entries for a path
+    replace earlier ones, and the file is rewritten without them once they
+    make up most of it. All methods are safe to call from several threads.
+    """
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+        self._entries = {}
+        self._lines = 0
+        self._inode = None
+        self._offset = 0
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        """
+        Read the entries appended to the file since it was last read.
+        """
+        try:
+            stat = os.stat(self.cache_file)
+        except FileNotFoundError:
+            return
+        if stat.st_ino != self._inode or stat.st_size < self._offset:
+            # (the file was rewritten)
+            self._entries, self._lines, self._inode, self._offset = {}, 0, stat.st_ino, 0
+        if stat.st_size == self._offset:
+            return
+        with open(self.cache_file, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        # (a line still being written by another process is read next time)
+        data = data[:data.rfind(b'\n') + 1]
+        for line in data.splitlines():
+            try:
+                path, inode, size, mtime, digest = json.loads(line)
+            except ValueError:
+                continue
+            self._entries[path] = (inode, size, mtime, digest)
+            self._lines += 1
+        self._offset += len(data)
+
+    def get(self, path, algorithm=None):
+        """
+        Return the cached digest of a file (computed with `algorithm`, if
+        given), or None if it is unknown or the file has changed since.
+        """
+        stat = os.stat(path)
+        with self._lock:
+            self._refresh()
+            entry = self._entries.get(os.path.abspath(path))
+        if entry is None or entry[:3] != (stat.st_ino, stat.st_size, stat.st_mtime_ns):
+            return None
+        if algorithm and split_digest(entry[3])[0] != algorithm:
+            return None
+        return entry[3]
+
+    def put(self, path, digest, stat=None):
+        """
+        Record the digest of a file. Pass the `stat` of the file from before
+        it was hashed, if it could have changed since.
+        """
+        stat = stat or os.stat(path)
+        path = os.path.abspath(path)
+        entry = (stat.st_ino, stat.st_size, stat.st_mtime_ns, digest)
+        with self._lock:
+            self._refresh()
+            if self._entries.get(path) == entry:
+                return
+            self._entries[path] = entry
+            if self._lines > 2 * len(self._entries) + 100:
+                self._write_all()
+                return
+            # (read back like any other appended line on the next refresh)
+            with open(self.cache_file, 'ab') as f:
+                f.write(self._line(path, entry))
+
+    def _write_all(self):
+        with atomic_path(self.cache_file) as tmp_file:
+            with open(tmp_file, 'wb') as f:
+                for path, entry in self._entries.items():
+                    f.write(self._line(path, entry))
+        stat = os.stat(self.cache_file)
+        self._lines, self._inode, self._offset = len(self._entries), stat.st_ino, stat.st_size
+
+    def _line(self, path, entry):
+        return (json.dumps([path] + list(entry)) + '\n').encode()
+
+
+@contextmanager
+def atomic_path(path):
+    """
+    Yield a temporary path in the same directory as `path`. If the block
+    completes, the temporary file is renamed over `path` in one step;
+    otherwise it is removed, and `path` is left untouched either way.
+    """
+    directory, basename = os.path.split(os.path.abspath(path))
+    # (created by the caller, so that it gets the usual permissions)
+    tmp_path = os.path.join(directory, '.{}.{}.tmp'.format(basename, uuid4().hex))
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Hold an exclusive lock on the file at `path` (created if needed) within a
+    block, waiting for any other holder, in this process or another, to
+    release it. Where `fcntl` is unavailable, no lock is taken.
+    """
+    with open(path, 'a') as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
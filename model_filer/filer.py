@@ -1,11 +1,60 @@
-from .remotes import DriveRemote, S3Remote
-from .registry import Registry
+from . import buffers, chunking
+from .buffers import BUFFER_EXTENSION
+from .cache import ObjectCache
+from .chunking import CHUNK_EXTENSION, MANIFEST_EXTENSION, ChunkStore
+from .composite import Composite
+from .compression import get_codec
+from .fileio import (CHUNK_SIZE, DEFAULT_ALGORITHM, PART_EXTENSION, DigestCache, DigestMismatchError,
+                     HashingWriter, atomic_path, combine_digests, file_digest, file_lock,
+                     format_digest, new_hash, split_digest)
+from .metrics import NULL_TIMER, PhaseTimer, TimedFile, emit
+from .remotes import DriveRemote, get_remote_type
+from .registry import Registry, RegistryEntry, format_timestamp
+from .sqlite_registry import SQLiteRegistry
 
 import dill
+import functools
+import hashlib
+import multiprocessing
 import os
+import threading
+import time
+from collections import Counter, deque
+from collections.abc import Mapping
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
 from datetime import datetime
 
 FILE_EXTENSION = '.pkl'
+SHARD_EXTENSION = '.shard{}'
+
+_MISSING = object()
+
+# State inherited by the forked workers of `Filer.dump_many`
+_fork_state = None
+_fork_lock = threading.Lock()
+
+
+class TransferError(Exception):
+    """
+    Raised at the end of a batch transfer (or `dump_many`, or a bulk delete)
+    if any of its files failed.
+
+    The files that succeeded have already been transferred and registered.
+    `errors` maps the name of each failed file to the exception it raised.
+    """
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("{} file(s) failed to transfer: {}".format(
+            len(errors), ', '.join(sorted(errors))))
+
+
+def __getattr__(name):
+    # (S3Remote is imported on first access, as in `remotes`)
+    if name == 'S3Remote':
+        from .remotes import S3Remote
+        return S3Remote
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
 
 
 class Filer():
@@ -19,39 +68,263 @@ class Filer():
         stored
     remote_connection : string
         String specifying how to connect to the remote (varies by remote type)
-    remote_type : 'drive' or 's3'
-        String specifying what type of remote connection to use
+    remote_type : 'drive', 's3', 'http' or another registered type
+        String specifying what type of remote connection to use. Packages can
+        add remote types; see `model_filer.remotes`.
+    max_workers : int (default 1)
+        Number of files transferred concurrently by the batch methods
+        (`push_all`, `pull_all`, `pull_many`). Can be overridden per call.
+    codec : string or None (default None)
+        Compression codec used by `dump` ('gzip', 'bz2', 'lzma', 'zstd' or
+        'lz4'), or None to store plain pickles. Can be overridden per call.
+    content_addressed : boolean (default False)
+        If True, remote objects are named by the digest of their contents, and
+        pushing a file whose contents already exist remotely skips the upload.
+    cache : int, ObjectCache or None (default None)
+        If given, objects returned by `load` are kept in memory and returned
+        again on later calls until their registry entry changes. An int sets
+        the approximate byte budget of a new `ObjectCache`; an `ObjectCache`
+        instance can be shared between filers.
+    metrics : callable, list of callables or None (default None)
+        Metrics sinks, each called with a `model_filer.metrics.Event` for every
+        phase of every operation (registry lookup, serialize, write, upload,
+        download, verify, read, deserialize). See `MetricsAggregator` for a sink that
+        reports percentiles. Sinks can also be appended to `self.metrics`.
+    registry_backend : 'tsv' or 'sqlite' (default 'tsv')
+        'sqlite' keeps the registry in a local SQLite database (in WAL mode)
+        that several processes can update concurrently. It is seeded from the
+        TSV registry file, and `self.registry.export_tsv()` writes it back.
+    max_local_bytes : int or None (default None)
+        If given, local copies of synced files are deleted, least recently
+        loaded first, whenever the files in `local_path` take up more than
+        this. `load` pulls an evicted file again when it is next needed.
+        Files in 'local' status are never evicted.
+    warm_set : list of strings or None (default None)
+        Names to `warm` in the background as soon as the filer is created.
+        The futures are kept in `self.warm_futures`.
+    remote_options : dict or None (default None)
+        Extra keyword arguments for the remote, e.g. the `bucket`, `prefix`
+        and `transfer_config` of an `S3Remote`.
+    shared_cache : string or None (default None)
+        Path to a directory shared by all filers on the host, e.g. those of
+        several worker processes. Pulled files are downloaded into it once,
+        by whichever filer needs them first while the others wait, and then
+        hard-linked (or, across file systems, symlinked) into `local_path`.
+        A write through one of the links corrupts the cached file; this is
+        detected, and the file downloaded again, as long as `verify` is on.
+    chunked : boolean (default False)
+        If True, pushed files are split into content-defined chunks of about
+        1MB and stored as a manifest listing them, so that chunks the remote
+        already has (e.g. from a previous version of a model) are not uploaded
+        again. Pulls keep the chunks they download in `local_path/.chunks`,
+        and only download the chunks missing from there. The chunks count
+        towards `max_local_bytes`, and are evicted first. Up to `max_workers`
+        chunks are transferred at once. Chunking is much faster with numpy
+        installed.
+    digest_algorithm : string (default 'sha256')
+        Algorithm of the digests recorded by `dump`: any `hashlib` algorithm,
+        or the much faster 'xxh3_128' (with xxhash installed) or 'blake3'
+        (with blake3 installed). Files keep the algorithm they were written
+        with, so this can be changed at any time, but content-addressed
+        objects are only shared between files with the same algorithm.
+    verify : boolean (default True)
+        If True, `load` checks local files against their registry digest
+        before unpickling them, and pulls a corrupt copy of a synced file
+        again. Each file is only hashed once (usually as it is downloaded),
+        and its digest is cached in `local_path/.digest_cache` until the file
+        changes.
     """
-    def __init__(self, local_path, remote_connection=None, remote_type='drive'):
+    def __init__(self, local_path, remote_connection=None, remote_type='drive', max_workers=1,
+                 codec=None, content_addressed=False, cache=None, metrics=None,
+                 registry_backend='tsv', max_local_bytes=None, warm_set=None, remote_options=None,
+                 shared_cache=None, chunked=False, digest_algorithm=DEFAULT_ALGORITHM,
+                 verify=True):
         # Validate local path
         if not os.path.isdir(local_path):
             raise FileNotFoundError("Local path '{}' is not a valid directory".format(local_path))
         self.local_path = local_path
+        self.max_workers = max_workers
+        self.codec = get_codec(codec)
+        self.content_addressed = content_addressed
+        if isinstance(cache, int):
+            cache = ObjectCache(cache)
+        self.cache = cache
+        if callable(metrics):
+            metrics = [metrics]
+        self.metrics = list(metrics or [])
+        self.max_local_bytes = max_local_bytes
+        if shared_cache is not None and not os.path.isdir(shared_cache):
+            raise FileNotFoundError("Shared cache '{}' is not a valid directory".format(shared_cache))
+        self.shared_cache = shared_cache
+        self.chunked = chunked
+        self.chunk_store = ChunkStore(os.path.join(local_path, '.chunks'))
+        new_hash(digest_algorithm)  # (fails early if it is not available)
+        self.digest_algorithm = digest_algorithm
+        self.verify = verify
+        self.digest_cache = DigestCache(os.path.join(local_path, '.digest_cache'))
+        self._in_use = Counter()
+        self._evict_lock = threading.Lock()
+        self._in_flight = {}
+        self._flight_lock = threading.Lock()
+        self._background = None
 
         # Set up remote connection
-        if remote_type == 'drive':
-            self.remote = DriveRemote(remote_connection)
-            registry_filename = '.drive_registry'
-        elif remote_type == 's3':
-            self.remote = S3Remote(remote_connection)
-            registry_filename = '.s3_registry'
-        else:
-            raise ValueError("Unsupported remote type: {}".format(remote_type))
+        remote_class = get_remote_type(remote_type)
+        self.remote = remote_class(remote_connection, **(remote_options or {}))
 
         # Create registry object
-        self.registry = Registry(os.path.join(local_path, registry_filename))
+        # (a remote that mirrors another reads the registry of that one)
+        registry_type = getattr(self.remote, 'mirror_of', None) or remote_type
+        registry_file = os.path.join(local_path, '.{}_registry'.format(registry_type))
+        if registry_backend == 'tsv':
+            self.registry = Registry(registry_file)
+        elif registry_backend == 'sqlite':
+            self.registry = SQLiteRegistry(registry_file + '.sqlite', tsv_file=registry_file)
+        else:
+            raise ValueError("Unsupported registry backend: {}".format(registry_backend))
+
+        self.warm_futures = self.warm(warm_set) if warm_set else {}
 
     def _get_local_filename(self, name):
         return os.path.join(self.local_path, name + FILE_EXTENSION)
 
-    def show_files(self):
+    def _get_buffer_filename(self, name):
+        return os.path.join(self.local_path, name + BUFFER_EXTENSION)
+
+    def _get_shard_filename(self, name, index):
+        return os.path.join(self.local_path, name + SHARD_EXTENSION.format(index))
+
+    def _sidecars(self, name, registry_entry):
+        """
+        Return (local file, remote address suffix) pairs for the files stored
+        alongside the main pickle of an entry.
+        """
+        if registry_entry.layout == 'oob':
+            return [(self._get_buffer_filename(name), BUFFER_EXTENSION)]
+        if registry_entry.sharded:
+            return [(self._get_shard_filename(name, index), SHARD_EXTENSION.format(index))
+                    for index in range(registry_entry.shard_count)]
+        return []
+
+    def _local_files(self, name, registry_entry):
+        return [self._get_local_filename(name)] + [
+            local_file for local_file, _ in self._sidecars(name, registry_entry)]
+
+    def _remote_addresses(self, name, registry_entry):
+        return [registry_entry.address] + [
+            registry_entry.address + suffix for _, suffix in self._sidecars(name, registry_entry)]
+
+    def _cache_key(self, name):
+        # (the local path keeps names apart when a cache is shared by filers)
+        return (os.path.abspath(self.local_path), name)
+
+    def _invalidate(self, name, registry_entry=None):
+        if self.cache is not None:
+            self.cache.invalidate(self._cache_key(name))
+            if registry_entry is not None:
+                # (the components of a sharded entry are cached on their own)
+                for index in range(registry_entry.shard_count):
+                    self.cache.invalidate(self._cache_key(name) + (index,))
+
+    def _timer(self, phase, name):
+        """
+        Return a context manager reporting the duration of a phase to the
+        metrics sinks (or doing nothing at all if there are none).
+        """
+        if not self.metrics:
+            return NULL_TIMER
+        return PhaseTimer(self.metrics, phase, name)
+
+    def _find(self, name):
+        with self._timer('registry', name):
+            return self.registry.find_by_name(name)
+
+    @contextmanager
+    def _pin(self, name):
+        """
+        Protect the local files of `name` from eviction within a block.
+        """
+        with self._evict_lock:
+            self._in_use[name] += 1
+        try:
+            yield
+        finally:
+            with self._evict_lock:
+                self._in_use[name] -= 1
+
+    def _touch(self, local_files):
+        """
+        Mark local files as just used, for LRU eviction. (Only access times
+        are changed, since not all file systems keep them up to date on their
+        own.)
+        """
+        now = time.time_ns()
+        for local_file in local_files:
+            os.utime(local_file, ns=(now, os.stat(local_file).st_mtime_ns))
+
+    def _enforce_quota(self):
+        if self.max_local_bytes is not None:
+            self.evict()
+
+    def _run_batch(self, func, names, max_workers):
+        """
+        Call `func(name)` for every name on a bounded thread pool.
+
+        Returns a dict mapping each name that succeeded to its result, and a
+        dict mapping each name that failed to its exception. A failure does
+        not stop the rest of the batch.
         """
-        Read the registry and display names and statuses.
+        if max_workers is None:
+            max_workers = self.max_workers
+        results, errors = {}, {}
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = {name: executor.submit(func, name) for name in names}
+            for name, future in futures.items():
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    errors[name] = e
+        return results, errors
+
+    def show_files(self, status=None, prefix=None):
+        """
+        Read the registry and display names and statuses, optionally only of
+        the files with a given status or whose name starts with `prefix`.
         """
-        for entry in self.registry.get_all_entries():
+        for entry in self.registry.iter_entries(status=status, prefix=prefix):
             print("{} ({})".format(entry.name, entry.status))
 
-    def dump(self, obj, name, push=False, overwrite=False):
+    def status(self):
+        """
+        Check every registered file against the local directory and the
+        remote, using one listing of each rather than a request per file.
+
+        Returns a dict mapping each name to a dict with its registry 'status',
+        whether all its files are present locally ('local'), and whether all
+        its remote objects exist ('remote', None for files not pushed yet, or
+        if the remote cannot list its objects).
+        """
+        with os.scandir(self.local_path) as files:
+            local_files = set(f.path for f in files)
+        try:
+            remote_urls = set(self.remote.url(address) for address in self.remote.list_addresses())
+        except NotImplementedError:
+            # (e.g. an HTTP remote)
+            remote_urls = None
+        report = {}
+        for entry in self.registry.iter_entries():
+            remote = None
+            if entry.status == 'synced' and remote_urls is not None:
+                remote = all(self.remote.url(address) in remote_urls
+                             for address in self._remote_addresses(entry.name, entry))
+            report[entry.name] = {
+                'status': entry.status,
+                'local': all(f in local_files for f in self._local_files(entry.name, entry)),
+                'remote': remote}
+        return report
+
+    def dump(self, obj, name, push=False, overwrite=False, codec=None, out_of_band=False,
+             stream=False, sharded=False):
         """
         Pickle an object and add it to the registry.
 
@@ -66,25 +339,261 @@ class Filer():
         overwrite: : boolean (default False)
             If True, overwrite any existing file with the same name. Otherwise
             an error will be raised if a file exists with the name.
+        codec : string or None (default None)
+            Compression codec to use for this file instead of the Filer's
+            default. Pass 'none' to store an uncompressed pickle.
+        out_of_band : boolean (default False)
+            If True, large buffers such as numpy array data are written
+            uncompressed to an aligned `.buf` file next to the pickle, and
+            `load` memory-maps them instead of reading them into memory.
+            Arrays loaded this way are read-only.
+        stream : boolean (default False)
+            If True, pickle straight into a new remote object instead of a
+            local file, and register it as synced once the upload is
+            complete. No local copy is written; `load` pulls one when needed.
+        sharded : boolean (default False)
+            If True, `obj` must be a mapping (e.g. a dict of pipeline
+            components), and each of its values is stored as a separate shard.
+            `load` then returns a read-only mapping that pulls and unpickles
+            each component only when it is first accessed.
         """
-        local_file = self._get_local_filename(name)
-        # Handle overwriting
-        registry_entry = self.registry.find_by_name(name)
+        if sharded and (stream or out_of_band):
+            raise ValueError("Sharded dumps cannot be streamed or written out of band")
+        codec = self.codec if codec is None else get_codec(codec)
+        codec_name = codec.name if codec else None
+        registry_entry = self._check_overwrite(name, overwrite)
+        status, address = 'local', None
+        layout = 'oob' if out_of_band else None
+        if stream:
+            status = 'synced'
+            address, digest = self._stream(obj, name, codec, out_of_band)
+        elif sharded:
+            digest, shard_count = self._write_shards(obj, name, codec)
+            layout = 'shards:{}'.format(shard_count)
+        else:
+            buffer_file = self._get_buffer_filename(name) if out_of_band else None
+            digest = self._write(obj, name, codec, buffer_file)
+            if not out_of_band:
+                self.digest_cache.put(self._get_local_filename(name), digest)
+        if registry_entry:
+            self._discard_stale(name, registry_entry, layout, local=not stream)
+        timestamp = format_timestamp(datetime.now())
+        if registry_entry:
+            self.registry.update_entry(name, status=status, address=address, timestamp=timestamp,
+                                       codec=codec_name, digest=digest, layout=layout)
+        else:
+            self.registry.add_entry(name, status, address, timestamp, codec=codec_name, digest=digest,
+                                    layout=layout)
+        if push and not stream:
+            self.push(name)
+        else:
+            self._enforce_quota()
+
+    def _write(self, obj, name, codec, buffer_file=None):
+        """
+        Pickle `obj` to the local file for `name`, and its large buffers to
+        `buffer_file` if given. Returns the digest of everything written.
+
+        The files are written under temporary names and only renamed into place
+        once all of them are complete, so an interrupted dump never leaves a
+        truncated file behind.
+        """
+        with ExitStack() as renames:
+            tmp_file = renames.enter_context(atomic_path(self._get_local_filename(name)))
+            if buffer_file:
+                tmp_buffer_file = renames.enter_context(atomic_path(buffer_file))
+            with ExitStack() as files:
+                fileobj = files.enter_context(open(tmp_file, 'wb'))
+                buffer_fileobj = files.enter_context(open(tmp_buffer_file, 'wb')) if buffer_file else None
+                digest, _ = self._serialize(obj, name, codec, fileobj, buffer_fileobj)
+        return digest
+
+    def _check_overwrite(self, name, overwrite):
+        """
+        Return the existing registry entry for `name`, if any, after checking
+        that it may be overwritten.
+        """
+        registry_entry = self._find(name)
         if registry_entry:
             if not overwrite:
                 raise ValueError("Cannot write to name '{}': file already exists in registry".format(name))
             if registry_entry.status == 'synced':
                 raise ValueError("Cannot overwrite file '{}' because it has already been pushed. ".format(name) +
                                  "To force overwrite, first remove existing registry entry and then retry.")
-            if os.path.isfile(local_file):
+        return registry_entry
+
+    def _discard_stale(self, name, registry_entry, layout, local=True):
+        """
+        After overwriting an entry, forget its cached object and remove any of
+        its local files that a new version with `layout` no longer has (or all
+        of them, if the new version has no local files).
+        """
+        self._invalidate(name, registry_entry)
+        kept = self._local_files(name, registry_entry.replace(layout=layout)) if local else []
+        for local_file in self._local_files(name, registry_entry):
+            if local_file not in kept and os.path.isfile(local_file):
                 os.remove(local_file)
-            self.registry.remove_entry(name)
-        dill.dump(obj, open(local_file, 'wb'))
-        timestamp = datetime.now().strftime("%Y-%m-%d::%H:%M:%S")
-        self.registry.add_entry(name, 'local', None, timestamp)
+
+    def dump_many(self, objs, push=False, overwrite=False, codec=None, out_of_band=False,
+                  max_workers=None, processes=True):
+        """
+        Pickle several objects in parallel and register them all at once.
+
+        Parameters
+        ----------
+        objs : dict
+            Maps each name to the object to store under it.
+        push : boolean (default False)
+            If True, push the new files concurrently once they are written.
+        overwrite, codec, out_of_band :
+            As for `dump`.
+        max_workers : int or None (default None)
+            Number of objects serialized at once. Defaults to the CPU count.
+        processes : boolean (default True)
+            If True and the platform can fork, serialize in worker processes,
+            which inherit the objects without copying them. An object whose
+            worker fails (e.g. because it cannot survive a fork) is retried in
+            this process. Otherwise, or if False, serialize on threads. Threads
+            are also used while the process runs other threads (e.g. those of
+            `prefetch`), since a forked child could deadlock on a lock one of
+            them held.
+
+        The registry is written once for the whole batch. If some objects
+        fail, the others are still registered (and pushed) and a
+        `TransferError` is then raised.
+        """
+        codec = self.codec if codec is None else get_codec(codec)
+        codec_name = codec.name if codec else None
+        registry_entries = {name: self._check_overwrite(name, overwrite) for name in objs}
+        max_workers = max_workers or os.cpu_count() or 1
+        digests, errors = {}, {}
+        if (processes and max_workers > 1 and len(objs) > 1
+                and 'fork' in multiprocessing.get_all_start_methods()
+                and threading.active_count() == 1):
+            digests = self._dump_forked(objs, codec, out_of_band, max_workers)
+        remaining = [name for name in objs if name not in digests]
+
+        def write(name):
+            buffer_file = self._get_buffer_filename(name) if out_of_band else None
+            return self._write(objs[name], name, codec, buffer_file)
+        written, errors = self._run_batch(write, remaining, max_workers)
+        digests.update(written)
+
+        layout = 'oob' if out_of_band else None
+        timestamp = format_timestamp(datetime.now())
+        entries = []
+        for name, digest in digests.items():
+            if registry_entries[name]:
+                self._discard_stale(name, registry_entries[name], layout)
+            if not out_of_band:
+                # (as in `dump`; forked workers' own caches never reach this one)
+                self.digest_cache.put(self._get_local_filename(name), digest)
+            entries.append(RegistryEntry(name, 'local', None, timestamp, codec=codec_name,
+                                         digest=digest, layout=layout))
+        self.registry.put_entries(entries)
         if push:
-            self.push(name)
-        # (what happens if this gets interrupted?)
+            errors.update(self._push_many(list(digests), max_workers))
+        else:
+            self._enforce_quota()
+        if errors:
+            raise TransferError(errors)
+
+    def _dump_forked(self, objs, codec, out_of_band, max_workers):
+        """
+        Write objects in forked worker processes. Returns a dict mapping the
+        name of each object written to its digest; failures are left out.
+        """
+        global _fork_state
+        digests = {}
+        with _fork_lock:
+            _fork_state = (self, objs, codec, out_of_band)
+            try:
+                context = multiprocessing.get_context('fork')
+                with ProcessPoolExecutor(max_workers=min(max_workers, len(objs)),
+                                         mp_context=context) as executor:
+                    futures = {name: executor.submit(_write_forked, name) for name in objs}
+                    for name, future in futures.items():
+                        try:
+                            digests[name] = future.result()
+                        except Exception:
+                            pass
+            finally:
+                _fork_state = None
+        return digests
+
+    def _write_shards(self, obj, name, codec):
+        """
+        Pickle each value of the mapping `obj` to its own shard file, and a
+        manifest of the keys and shard digests to the local file for `name`.
+        Returns the digest of everything written and the number of shards.
+        """
+        if not isinstance(obj, Mapping):
+            raise TypeError("Sharded dumps need a mapping, not {}".format(type(obj).__name__))
+        shards = []
+        with ExitStack() as renames:
+            for index, (key, value) in enumerate(obj.items()):
+                tmp_file = renames.enter_context(atomic_path(self._get_shard_filename(name, index)))
+                with open(tmp_file, 'wb') as f:
+                    digest, _ = self._serialize(value, name, codec, f)
+                shards.append((key, digest))
+            tmp_file = renames.enter_context(atomic_path(self._get_local_filename(name)))
+            with open(tmp_file, 'wb') as f:
+                manifest_digest, _ = self._serialize({'shards': shards}, name, None, f)
+        return combine_digests([manifest_digest] + [digest for _, digest in shards]), len(shards)
+
+    def _stream(self, obj, name, codec, out_of_band):
+        """
+        Pickle `obj` straight into new remote objects, without a local copy.
+        Returns the address and digest to register.
+        """
+        address = self.remote.address(name)
+        suffixes = [''] + ([BUFFER_EXTENSION] if out_of_band else [])
+        with self._timer('upload', name) as timer:
+            with ExitStack() as uploads:
+                writers = [uploads.enter_context(self.remote.open_writer(address + suffix))
+                           for suffix in suffixes]
+                digest, nbytes = self._serialize(obj, name, codec, *writers)
+            if self.content_addressed:
+                # (the name depends on the digest, which is only known now)
+                final_address = self.remote.address(name, digest)
+                for suffix in suffixes:
+                    if self.remote.exists(final_address + suffix):
+                        self.remote.delete(address + suffix)
+                    else:
+                        self.remote.move(address + suffix, final_address + suffix)
+                address = final_address
+            if self.metrics:
+                timer.nbytes = nbytes
+        return address, digest
+
+    def _serialize(self, obj, name, codec, fileobj, buffer_fileobj=None):
+        """
+        Pickle `obj` to `fileobj`, and its large buffers to `buffer_fileobj` if
+        given. Returns the digest and size of everything written.
+        """
+        timed_files = []
+
+        def wrap(f):
+            if self.metrics:
+                f = TimedFile(f)
+                timed_files.append(f)
+            return HashingWriter(f, self.digest_algorithm)
+
+        start = time.perf_counter()
+        writer = wrap(fileobj)
+        with ExitStack() as files:
+            stream = files.enter_context(codec.open_writer(writer)) if codec else writer
+            if buffer_fileobj is not None:
+                buffer_writer = wrap(buffer_fileobj)
+                buffers.dump(obj, stream, buffer_writer)
+            else:
+                dill.dump(obj, stream)
+        if self.metrics:
+            self._emit_io('serialize', 'write', name, time.perf_counter() - start, timed_files)
+        if buffer_fileobj is not None:
+            return (combine_digests([writer.digest(), buffer_writer.digest()]),
+                    writer.bytes_written + buffer_writer.bytes_written)
+        return writer.digest(), writer.bytes_written
 
     def load(self, name):
         """
@@ -95,61 +604,688 @@ class Filer():
         name : string
             The name of the stored object.
         """
-        registry_entry = self.registry.find_by_name(name)
+        registry_entry = self._find(name)
         if not registry_entry:
             raise ValueError("File '{}' not found in registry".format(name))
+        if self.cache is not None:
+            version = (registry_entry.timestamp, registry_entry.digest)
+            obj = self.cache.get(self._cache_key(name), version, _MISSING)
+            if obj is not _MISSING:
+                return obj
         local_file = self._get_local_filename(name)
-        if not os.path.isfile(local_file):
-            if registry_entry.status == 'synced':
-                self.pull(name)
+        with self._pin(name):
+            if registry_entry.sharded:
+                # (shards are only needed once their components are accessed)
+                self._require(name, registry_entry, [local_file], self._pull_manifest,
+                              self._manifest_check(registry_entry))
+                obj, size = self._read_composite(name, registry_entry)
+                used_files = [local_file]
+            else:
+                used_files = self._local_files(name, registry_entry)
+                self._require(name, registry_entry, used_files, self.pull)
+                obj, size = self._read(local_file, registry_entry)
+            if self.max_local_bytes is not None:
+                self._touch(used_files)
+        if self.cache is not None:
+            self.cache.put(self._cache_key(name), version, obj, size)
+        return obj
+
+    def _require(self, name, registry_entry, local_files, pull, check=None):
+        """
+        Make sure `local_files` exist and are intact (see `_intact`), calling
+        `pull(name)` if they are missing or corrupt and can be pulled.
+        """
+        if all(os.path.isfile(f) for f in local_files):
+            if not self.verify or self._intact(name, registry_entry, local_files, check):
+                return
+            if registry_entry.status != 'synced':
+                raise DigestMismatchError("Local file '{}' does not match its registry digest".format(name))
+            for local_file in local_files:
+                os.remove(local_file)
+            pull(name)
+            # (a pull can reuse a copy from elsewhere, which may be corrupt as well)
+            if not self._intact(name, registry_entry, local_files, check):
+                raise DigestMismatchError("Local file '{}' is still corrupt after pulling it again".format(name))
+        elif registry_entry.status == 'synced':
+            pull(name)
+        else:
+            raise FileNotFoundError("Locally registered file '{}' not found".format(name))
+
+    def _intact(self, name, registry_entry, local_files, check=None):
+        """
+        Return whether local files match the entry's digest, or pass
+        `check(local_files, digests)` if given. Digests are only computed for
+        files that changed since they were last hashed.
+        """
+        if not registry_entry.digest:
+            # (written before digests were recorded)
+            return True
+        algorithm = split_digest(registry_entry.digest)[0]
+        digests = []
+        for local_file in local_files:
+            digest = self.digest_cache.get(local_file, algorithm)
+            if digest is None:
+                with self._timer('verify', name) as timer:
+                    stat = os.stat(local_file)
+                    digest = file_digest(local_file, algorithm)
+                    if self.metrics:
+                        timer.nbytes = stat.st_size
+                self.digest_cache.put(local_file, digest, stat)
+            digests.append(digest)
+        if check is None:
+            return self._matches(registry_entry, digests)
+        return check(local_files, digests)
+
+    def _matches(self, registry_entry, digests):
+        digest = digests[0] if len(digests) == 1 else combine_digests(digests)
+        return not registry_entry.digest or digest == registry_entry.digest
+
+    def _read_composite(self, name, registry_entry):
+        """
+        Read the manifest of a sharded entry, returning a `Composite` mapping
+        that loads each component on first access, and the manifest's size.
+
+        With an object cache, components are cached under keys of their own
+        rather than kept by the `Composite`, so that the cache accounts for
+        each of them at the size of its shard.
+        """
+        local_file = self._get_local_filename(name)
+        shards = self._read_manifest(local_file)
+        digests = [digest for _, digest in shards]
+        load_shard = functools.partial(self._load_shard, name, registry_entry, digests)
+        return (Composite([key for key, _ in shards], load_shard, keep=self.cache is None),
+                os.path.getsize(local_file))
+
+    def _read_manifest(self, manifest_file):
+        with open(manifest_file, 'rb') as f:
+            return dill.load(f)['shards']
+
+    def _load_shard(self, name, registry_entry, digests, index):
+        if self.cache is not None:
+            key = self._cache_key(name) + (index,)
+            version = (registry_entry.timestamp, registry_entry.digest)
+            obj = self.cache.get(key, version, _MISSING)
+            if obj is not _MISSING:
+                return obj
+        shard_file = self._get_shard_filename(name, index)
+        with self._pin(name):
+            self._require(name, registry_entry, [shard_file],
+                          lambda name: self._pull_shard(name, registry_entry, index, digests[index]),
+                          lambda shard_files, shard_digests: shard_digests == [digests[index]])
+            obj, size = self._read(shard_file, registry_entry.replace(layout=None))
+            if self.max_local_bytes is not None:
+                self._touch([shard_file])
+        if self.cache is not None:
+            self.cache.put(key, version, obj, size)
+        return obj
+
+    def _read(self, local_file, registry_entry):
+        """
+        Unpickle a local file, returning the object and the size of its pickle.
+        """
+        start = time.perf_counter()
+        kwargs = {}
+        if registry_entry.layout == 'oob':
+            buffer_file = self._get_buffer_filename(registry_entry.name)
+            kwargs['buffers'] = buffers.open_buffers(buffer_file)
+        codec = get_codec(registry_entry.codec)
+        with open(local_file, 'rb') as f:
+            source = TimedFile(f) if self.metrics else f
+            if codec:
+                with codec.open_reader(source) as stream:
+                    obj, size = dill.load(stream, **kwargs), stream.tell()
             else:
-                raise FileNotFoundError("Locally registered file '{}' not found".format(name))
-        return dill.load(open(local_file, 'rb'))
+                obj, size = dill.load(source, **kwargs), source.tell()
+        if self.metrics:
+            self._emit_io('deserialize', 'read', registry_entry.name,
+                          time.perf_counter() - start, [source])
+        return obj, size
+
+    def _emit_io(self, phase, io_phase, name, seconds, timed_files):
+        """
+        Report a (de)serialization that took `seconds` in total, split into the
+        time spent in file calls and the time spent on everything else.
+        """
+        io_seconds = sum(f.seconds for f in timed_files)
+        io_bytes = sum(f.nbytes for f in timed_files)
+        emit(self.metrics, io_phase, name, io_seconds, io_bytes)
+        emit(self.metrics, phase, name, seconds - io_seconds, io_bytes)
 
     def push(self, name):
         """
         Push a file to the remote.
         """
-        registry_entry = self.registry.find_by_name(name)
+        changes = self._upload(name)
+        # Update registry entry
+        self.registry.update_entry(name, **changes)
+        self._enforce_quota()
+
+    def _upload(self, name):
+        """
+        Upload a local file to the remote without touching the registry.
+        Returns the changes to make to the file's registry entry.
+        """
+        registry_entry = self._find(name)
         if not registry_entry:
             raise ValueError("File '{}' not found in registry".format(name))
         if registry_entry.status == 'synced':
             raise ValueError("Cannot push file '{}'; already exists remotely".format(name))
         local_file = self._get_local_filename(name)
-        address = self.remote.upload(name, local_file)
-        # Update registry entry
-        old_entry = self.registry.remove_entry(name)
-        self.registry.add_entry(name, 'synced', address, old_entry.timestamp)
+        changes = {'status': 'synced'}
+        with self._timer('upload', name) as timer:
+            if self.content_addressed:
+                # (entries written before digests were recorded are hashed now)
+                digest = registry_entry.digest or file_digest(local_file, self.digest_algorithm)
+                changes['digest'] = digest
+            if self.chunked:
+                address = self.remote.address(name, changes.get('digest'), MANIFEST_EXTENSION)
+                if not (self.content_addressed and self.remote.exists(address)):
+                    self._put_chunked(local_file, address)
+            elif self.content_addressed:
+                address = self.remote.upload(name, local_file, digest=digest)
+            else:
+                address = self.remote.upload(name, local_file)
+            put = self._put_chunked if self.chunked else self.remote.put
+            for sidecar_file, suffix in self._sidecars(name, registry_entry):
+                if not (self.content_addressed and self.remote.exists(address + suffix)):
+                    put(sidecar_file, address + suffix)
+            if self.metrics:
+                timer.nbytes = sum(os.path.getsize(f) for f in self._local_files(name, registry_entry))
+        changes['address'] = address
+        return changes
+
+    def _put_chunked(self, local_file, remote_address):
+        """
+        Store a file at `remote_address` as a manifest of its chunks, uploading
+        only the chunks the remote does not have yet.
+        """
+        chunks = []
+        uploaded = set()
+        max_workers = max(1, self.max_workers)
+        with open(local_file, 'rb') as f, ThreadPoolExecutor(max_workers) as executor:
+            pending = deque()
+            for data in chunking.iter_chunks(f):
+                digest = chunking.chunk_digest(data)
+                chunks.append((digest, len(data)))
+                if digest not in uploaded:
+                    uploaded.add(digest)
+                    pending.append(executor.submit(self._put_chunk, digest, data))
+                    # (bounds the chunks held in memory)
+                    while len(pending) > max_workers:
+                        pending.popleft().result()
+            for future in pending:
+                future.result()
+        manifest_file = local_file + MANIFEST_EXTENSION
+        try:
+            chunking.write_manifest(manifest_file, chunks)
+            self.remote.put(manifest_file, remote_address)
+        finally:
+            os.remove(manifest_file)
+
+    def _put_chunk(self, digest, data):
+        address = self.remote.address(None, digest, CHUNK_EXTENSION)
+        if not self.remote.exists(address):
+            with self.remote.open_writer(address) as f:
+                f.write(data)
 
     def pull(self, name):
         """
         Pull a file from the remote.
+
+        If the file is already being pulled (e.g. by `prefetch` or another
+        thread), this waits for that pull instead of starting a second one.
         """
-        registry_entry = self.registry.find_by_name(name)
+        return self._pull_future(name).result()
+
+    def _pull_future(self, name, executor=None):
+        return self._single_flight(name, functools.partial(self._pull, name), executor)
+
+    def _single_flight(self, key, func, executor=None):
+        """
+        Return a future for `func()`, joining the call already in flight under
+        `key` if there is one. A new call is submitted to `executor`, or run in
+        the calling thread if None.
+        """
+        with self._flight_lock:
+            future = self._in_flight.get(key)
+            is_new = future is None or future.cancelled()
+            if is_new:
+                future = Future()
+                self._in_flight[key] = future
+        if is_new:
+            future.add_done_callback(lambda done: self._land(key, done))
+        if executor is None:
+            # (this also takes over a call that is still queued in the background,
+            # so waiting on it can never tie up the thread it needs)
+            self._run_flight(func, future)
+        elif is_new:
+            executor.submit(self._run_flight, func, future)
+        return future
+
+    def _run_flight(self, func, future):
+        """
+        Run the call behind `future`, unless another thread already has.
+        """
+        with self._flight_lock:
+            if future.running() or future.done():
+                return
+            if not future.set_running_or_notify_cancel():
+                return
+        try:
+            future.set_result(func())
+        except BaseException as e:
+            future.set_exception(e)
+
+    def _land(self, key, future):
+        with self._flight_lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def _pull(self, name):
+        registry_entry = self._find(name)
         if not registry_entry:
             raise ValueError("File '{}' not found in registry".format(name))
         if registry_entry.status == 'local':
             raise ValueError("Cannot pull file {} from remote; file is marked 'local'".format(name))
-        local_file = self._get_local_filename(name)
-        if not os.path.isfile(local_file):
-            self.remote.download(local_file, registry_entry.address)
+        local_files = self._local_files(name, registry_entry)
+        if all(os.path.isfile(f) for f in local_files):
+            return
+        with self._pin(name):
+            if self._copy_duplicate(registry_entry, local_files):
+                pass
+            elif registry_entry.sharded:
+                # (shard by shard, so as to share transfers with lazy loads)
+                self._pull_manifest(name, registry_entry)
+                shards = self._read_manifest(local_files[0])
+                for index, (_, digest) in enumerate(shards):
+                    self._pull_shard(name, registry_entry, index, digest)
+            else:
+                self._download(name, registry_entry)
+            self._enforce_quota()
+
+    def _copy_duplicate(self, registry_entry, local_files):
+        """
+        Copy the local files of another registered name with the same contents
+        into place, which saves a download. They are copied via temporary
+        files that are only renamed once they match the entry's digest.
+        Returns whether a duplicate was copied.
+        """
+        duplicate_files = self._find_local_duplicate(registry_entry)
+        if not duplicate_files:
+            return False
+        algorithm = split_digest(registry_entry.digest)[0]
+        digests = []
+        try:
+            with ExitStack() as renames:
+                for duplicate_file, local_file in zip(duplicate_files, local_files):
+                    tmp_file = renames.enter_context(atomic_path(local_file))
+                    file_hash = new_hash(algorithm)
+                    with open(duplicate_file, 'rb') as src, open(tmp_file, 'wb') as dst:
+                        for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                            dst.write(chunk)
+                            file_hash.update(chunk)
+                    digests.append(format_digest(file_hash))
+                if not self._matches(registry_entry, digests):
+                    # (the duplicate is corrupt; download instead)
+                    raise DigestMismatchError(registry_entry.name)
+        except (DigestMismatchError, FileNotFoundError):
+            return False
+        for local_file, digest in zip(local_files, digests):
+            self.digest_cache.put(local_file, digest)
+        return True
+
+    def _pull_manifest(self, name, registry_entry=None):
+        """
+        Pull only the manifest of a sharded entry, checking it against the
+        entry's digest (which covers the digests of the shards it lists).
+        """
+        registry_entry = registry_entry or self._find(name)
+        self._pull_part(name, registry_entry, self._get_local_filename(name), registry_entry.address,
+                        self._manifest_check(registry_entry))
+
+    def _manifest_check(self, registry_entry):
+        """
+        Return a check of the manifest of a sharded entry against the entry's
+        digest (which covers the digests of the shards it lists).
+        """
+        def check(manifest_files, digests):
+            try:
+                shards = self._read_manifest(manifest_files[0])
+            except Exception:
+                return False
+            return registry_entry.digest == combine_digests(
+                digests + [digest for _, digest in shards])
+        return check
+
+    def _pull_shard(self, name, registry_entry, index, digest):
+        self._pull_part(name, registry_entry, self._get_shard_filename(name, index),
+                        registry_entry.address + SHARD_EXTENSION.format(index),
+                        lambda part_files, digests: digests == [digest])
+
+    def _pull_part(self, name, registry_entry, local_file, address, check):
+        """
+        Download a single file of an entry unless it is already local. Calls
+        for the same file share one transfer.
+        """
+        def pull():
+            if not os.path.isfile(local_file):
+                self._download(name, registry_entry, [(local_file, address)], check)
+                self._enforce_quota()
+        with self._pin(name):
+            self._single_flight(local_file, pull).result()
+
+    def _download(self, name, registry_entry, targets=None, check=None):
+        """
+        Download the files of an entry to `.part` files, check them against the
+        entry's digest and only then move them into place. Part files left by
+        an interrupted download are resumed rather than started over.
+
+        To download only some of the files, pass `targets`, a list of (local
+        file, remote address) pairs, and `check(part_files, digests)`, which
+        returns whether the downloaded files are intact.
+        """
+        if targets is None:
+            targets = [(self._get_local_filename(name), registry_entry.address)]
+            for sidecar_file, suffix in self._sidecars(name, registry_entry):
+                targets.append((sidecar_file, registry_entry.address + suffix))
+        if self.shared_cache is None:
+            self._fetch(name, registry_entry, targets, check)
+        else:
+            self._fetch_shared(name, registry_entry, targets, check)
 
-    def push_all(self):
+    def _fetch_shared(self, name, registry_entry, targets, check):
+        """
+        Download files into the shared cache unless they are already there
+        and intact, holding their locks so that only one process downloads
+        each file, and then link them into `local_path`.
+        """
+        shared_targets = [(self._get_shared_filename(address), address) for _, address in targets]
+        shared_files = [shared_file for shared_file, _ in shared_targets]
+        with ExitStack() as locks:
+            for shared_file in sorted(set(shared_files)):
+                locks.enter_context(file_lock(shared_file + '.lock'))
+            if (self.verify and all(os.path.isfile(shared_file) for shared_file in shared_files)
+                    and not self._intact(name, registry_entry, shared_files, check)):
+                # (a corrupt link shares its inode with the cached file; other
+                # links to it are replaced as their filers find them corrupt)
+                for shared_file in shared_files:
+                    os.remove(shared_file)
+            if not all(os.path.isfile(shared_file) for shared_file in shared_files):
+                self._fetch(name, registry_entry, shared_targets, check)
+        for (local_file, _), (shared_file, _) in zip(targets, shared_targets):
+            with atomic_path(local_file) as tmp_file:
+                try:
+                    os.link(shared_file, tmp_file)
+                except OSError:
+                    os.symlink(os.path.abspath(shared_file), tmp_file)
+            digest = self.digest_cache.get(shared_file)
+            if digest:
+                self.digest_cache.put(local_file, digest)
+
+    def _get_shared_filename(self, remote_address):
+        key = hashlib.sha256(self.remote.url(remote_address).encode()).hexdigest()
+        return os.path.join(self.shared_cache, key + os.path.splitext(remote_address)[1])
+
+    def _fetch(self, name, registry_entry, targets, check):
+        """
+        Download each (file, remote address) target via a `.part` file, and
+        only move them into place if they are intact.
+        """
+        part_files = [local_file + PART_EXTENSION for local_file, _ in targets]
+        resumed = any(os.path.exists(part_file) for part_file in part_files)
+        kwargs = {}
+        if registry_entry.digest:
+            kwargs['algorithm'] = split_digest(registry_entry.digest)[0]
+        download = self.remote.download
+        if registry_entry.address.endswith(MANIFEST_EXTENSION):
+            download = self._download_chunked
+        with self._timer('download', name) as timer:
+            digests = [download(part_file, address, **kwargs)
+                       for part_file, (_, address) in zip(part_files, targets)]
+            if self.metrics:
+                timer.nbytes = sum(os.path.getsize(part_file) for part_file in part_files)
+        if check is None:
+            intact = self._matches(registry_entry, digests)
+        else:
+            intact = check(part_files, digests)
+        if not intact:
+            for part_file in part_files:
+                os.remove(part_file)
+            if resumed:
+                # (the parts may have been left over from another version of the file)
+                return self._fetch(name, registry_entry, targets, check)
+            raise DigestMismatchError("Downloaded file '{}' does not match its registry digest".format(name))
+        for part_file, (local_file, _), digest in zip(part_files, targets, digests):
+            os.replace(part_file, local_file)
+            self.digest_cache.put(local_file, digest)
+
+    def _download_chunked(self, local_file, remote_address, algorithm=DEFAULT_ALGORITHM):
+        """
+        Rebuild a chunked file from the chunk store, first downloading the
+        chunks it is missing. Returns the digest of the file, like
+        `remote.download`.
+        """
+        manifest_file = local_file + MANIFEST_EXTENSION
+        if os.path.exists(manifest_file):
+            os.remove(manifest_file)
+        self.remote.download(manifest_file, remote_address)
+        chunks = chunking.read_manifest(manifest_file)
+        os.remove(manifest_file)
+        missing = list(dict.fromkeys(digest for digest, _ in chunks if digest not in self.chunk_store))
+        _, errors = self._run_batch(self._pull_chunk, missing, None)
+        if errors:
+            raise next(iter(errors.values()))
+        file_hash = new_hash(algorithm)
+        with open(local_file, 'wb') as dst:
+            for digest, _ in chunks:
+                data = self._read_chunk(digest)
+                dst.write(data)
+                file_hash.update(data)
+        if self.max_local_bytes is not None:
+            self._touch([self.chunk_store.chunk_path(digest) for digest in dict.fromkeys(
+                digest for digest, _ in chunks)])
+        return format_digest(file_hash)
+
+    def _read_chunk(self, digest):
+        try:
+            with open(self.chunk_store.chunk_path(digest), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            # (evicted meanwhile, to make room for another file)
+            self._pull_chunk(digest)
+            with open(self.chunk_store.chunk_path(digest), 'rb') as f:
+                return f.read()
+
+    def _pull_chunk(self, digest):
+        """
+        Download a chunk into the chunk store, checking it against its digest.
+        Calls for the same chunk share one transfer.
+        """
+        chunk_file = self.chunk_store.chunk_path(digest)
+
+        def pull():
+            if os.path.isfile(chunk_file):
+                return
+            os.makedirs(self.chunk_store.path, exist_ok=True)
+            part_file = chunk_file + PART_EXTENSION
+            address = self.remote.address(None, digest, CHUNK_EXTENSION)
+            if self.remote.download(part_file, address) != digest:
+                os.remove(part_file)
+                raise DigestMismatchError("Downloaded chunk '{}' does not match its digest".format(digest))
+            os.replace(part_file, chunk_file)
+        self._single_flight(chunk_file, pull).result()
+
+    def _find_local_duplicate(self, registry_entry):
+        """
+        Return the local files of another registered name with the same digest
+        as `registry_entry`, or None.
+        """
+        if not registry_entry.digest:
+            return None
+        for entry in self.registry.find_by_digest(registry_entry.digest):
+            if entry.name != registry_entry.name:
+                local_files = self._local_files(entry.name, entry)
+                if all(os.path.isfile(f) for f in local_files):
+                    return local_files
+        return None
+
+    def push_all(self, max_workers=None):
         """
         Push all local files to the remote.
+
+        Uploads run concurrently on up to `max_workers` threads, and the
+        registry is updated once for the whole batch. If some uploads fail, the
+        rest are still registered and a `TransferError` is then raised.
+        """
+        names = [entry.name for entry in self.registry.iter_entries(status='local')]
+        errors = self._push_many(names, max_workers)
+        if errors:
+            raise TransferError(errors)
+
+    def _push_many(self, names, max_workers):
+        """
+        Upload files concurrently and register them in one write. Returns a
+        dict mapping each name that failed to its exception.
+        """
+        changes, errors = self._run_batch(self._upload, names, max_workers)
+        self.registry.update_entries(changes)
+        self._enforce_quota()
+        return errors
+
+    def pull_many(self, names, max_workers=None):
+        """
+        Pull several files from the remote concurrently.
+
+        Every file is attempted; if any of them fail, a `TransferError` is
+        raised once the others have finished.
         """
-        for entry in self.registry.get_all_entries():
-            if entry.status == 'local':
-                self.push(entry.name)
+        _, errors = self._run_batch(self.pull, names, max_workers)
+        if errors:
+            raise TransferError(errors)
 
-    def pull_all(self):
+    def pull_all(self, max_workers=None):
         """
         Pull all available files from the remote.
         """
-        for entry in self.registry.get_all_entries():
-            local_file = self._get_local_filename(entry.name)
-            if entry.status == 'synced' and not os.path.isfile(local_file):
-                self.pull(entry.name)
+        names = [entry.name for entry in self.registry.iter_entries(status='synced')
+                 if not all(os.path.isfile(f) for f in self._local_files(entry.name, entry))]
+        self.pull_many(names, max_workers=max_workers)
+
+    def verify_all(self, max_workers=None):
+        """
+        Check the local files of every registered name against its registry
+        digest, hashing up to `max_workers` files at once. Files that have not
+        changed since they were last hashed are not read again.
+
+        Returns the names whose local files are corrupt or could not be read.
+        Files that are not present locally are skipped.
+        """
+        entries = {entry.name: entry for entry in self.registry.iter_entries()}
+        results, errors = self._run_batch(lambda name: self._verify(name, entries[name]),
+                                          list(entries), max_workers)
+        return sorted([name for name, intact in results.items() if not intact] + list(errors))
+
+    def _verify(self, name, registry_entry):
+        """
+        Return whether the local files of an entry that are present are intact.
+        """
+        if not registry_entry.sharded:
+            local_files = self._local_files(name, registry_entry)
+            return (not all(os.path.isfile(f) for f in local_files)
+                    or self._intact(name, registry_entry, local_files))
+        manifest_file = self._get_local_filename(name)
+        if not os.path.isfile(manifest_file):
+            return True
+        if not self._intact(name, registry_entry, [manifest_file],
+                            self._manifest_check(registry_entry)):
+            return False
+        for index, (_, digest) in enumerate(self._read_manifest(manifest_file)):
+            shard_file = self._get_shard_filename(name, index)
+            if os.path.isfile(shard_file) and not self._intact(
+                    name, registry_entry, [shard_file],
+                    lambda shard_files, digests: digests == [digest]):
+                return False
+        return True
+
+    def _background_executor(self):
+        with self._flight_lock:
+            if self._background is None:
+                self._background = ThreadPoolExecutor(max_workers=max(1, self.max_workers),
+                                                      thread_name_prefix='model_filer')
+            return self._background
+
+    def prefetch(self, names):
+        """
+        Start pulling files in the background, on up to `max_workers` threads.
+
+        Returns a dict mapping each name to a `concurrent.futures.Future` that
+        completes when its file is local. A `load` or `pull` of a name that is
+        still being fetched waits for that transfer instead of starting another.
+        """
+        executor = self._background_executor()
+        return {name: self._pull_future(name, executor) for name in names}
+
+    def warm(self, names):
+        """
+        Start loading objects in the background, so that they are pulled and,
+        if the filer has a cache, deserialized into it before they are needed.
+
+        Returns a dict mapping each name to a `concurrent.futures.Future` for
+        the loaded object.
+        """
+        executor = self._background_executor()
+        return {name: executor.submit(self.load, name) for name in names}
+
+    def evict(self, max_bytes=None):
+        """
+        Delete local copies of synced files, least recently loaded first,
+        until the files in `local_path` take up at most `max_bytes` (by default
+        the filer's `max_local_bytes`). The files stay registered and can be
+        pulled again. Files in 'local' status and files being loaded are never
+        evicted. Chunks kept by chunked pulls count towards the total, and are
+        evicted (least recently used first) before any file.
+
+        Returns the names of the evicted files.
+        """
+        if max_bytes is None:
+            max_bytes = self.max_local_bytes
+        if max_bytes is None:
+            raise ValueError("No size to evict down to: pass max_bytes or set max_local_bytes")
+        with self._evict_lock:
+            usage = 0
+            candidates = []
+            for entry in self.registry.iter_entries():
+                stats = []
+                for local_file in self._local_files(entry.name, entry):
+                    try:
+                        stats.append(os.stat(local_file))
+                    except FileNotFoundError:
+                        pass
+                size = sum(stat.st_size for stat in stats)
+                usage += size
+                if stats and entry.status == 'synced' and not self._in_use[entry.name]:
+                    last_used = max(stat.st_atime_ns for stat in stats)
+                    candidates.append((last_used, entry, size))
+            chunks = self.chunk_store.usage()
+            usage += sum(size for _, size, _ in chunks)
+            for _, size, chunk_file in sorted(chunks):
+                if usage <= max_bytes:
+                    break
+                try:
+                    os.remove(chunk_file)
+                except FileNotFoundError:
+                    pass
+                usage -= size
+            evicted = []
+            for _, entry, size in sorted(candidates, key=lambda candidate: candidate[0]):
+                if usage <= max_bytes:
+                    break
+                for local_file in self._local_files(entry.name, entry):
+                    if os.path.isfile(local_file):
+                        os.remove(local_file)
+                usage -= size
+                evicted.append(entry.name)
+        return evicted
 
     def remove(self, name, remove_remote=False):
         """
@@ -157,15 +1293,110 @@ class Filer():
 
         By default, remote will not be removed in case
         it lives on in git history of the registry...
+        A content-addressed remote object that is still referenced by another
+        entry in the registry is never removed, and neither are the chunks of a
+        chunked file, which other files may share.
         """
+        if remove_remote:
+            self._check_writable()
         entry = self.registry.remove_entry(name)
+        self._invalidate(name, entry)
         if remove_remote and (entry.status == 'synced'):
-            self.remote.delete(entry.address)
+            still_referenced = any(other.address == entry.address
+                                   for other in self.registry.iter_entries())
+            if not still_referenced:
+                for address in self._remote_addresses(name, entry):
+                    self.remote.delete(address)
+
+    def remove_many(self, names, remove_remote=False):
+        """
+        Like `remove` for several names, with a single registry write and
+        remote objects deleted in batches (of up to 1000 on S3).
+
+        If some remote objects cannot be deleted, the names are still removed
+        from the registry and a `TransferError` is raised.
+        """
+        if remove_remote:
+            self._check_writable()
+        entries = self.registry.remove_entries(names)
+        for entry in entries:
+            self._invalidate(entry.name, entry)
+        if remove_remote:
+            referenced = set(entry.address for entry in self.registry.iter_entries())
+            addresses = [address for entry in entries
+                         if entry.status == 'synced' and entry.address not in referenced
+                         for address in self._remote_addresses(entry.name, entry)]
+            errors = self.remote.delete_many(list(dict.fromkeys(addresses)))
+            if errors:
+                raise TransferError(errors)
+
+    def find_orphans(self, min_age=3600):
+        """
+        Return the remote objects that no registry entry refers to, e.g. those
+        left behind by `remove` or by overwriting a pushed file, and that were
+        last modified at least `min_age` seconds ago (so that objects being
+        pushed right now are left alone).
+
+        Chunks of chunked files are never included; other files may use them.
+        """
+        referenced = set(self.remote.url(address)
+                         for entry in self.registry.iter_entries() if entry.address
+                         for address in self._remote_addresses(entry.name, entry))
+        cutoff = time.time() - min_age
+        return sorted(address for address, modified in self.remote.list_addresses().items()
+                      if modified <= cutoff and not address.endswith(CHUNK_EXTENSION)
+                      and self.remote.url(address) not in referenced)
+
+    def collect_garbage(self, min_age=3600, dry_run=True, exclusive=False):
+        """
+        Delete the remote objects returned by `find_orphans`, in batches.
+        Returns their addresses.
+
+        Objects referenced only by other registries (including older
+        revisions of this one in git) count as orphans, so by default this is
+        a dry run that only returns the objects that would be deleted. To
+        delete them, pass `dry_run=False`, and either give the remote a
+        non-empty prefix used by this registry alone (e.g. the `prefix` of an
+        `S3Remote`) or pass `exclusive=True` to confirm that the remote's
+        whole location belongs to this registry.
+        """
+        if not dry_run:
+            self._check_writable()
+            if not (exclusive or getattr(self.remote, 'prefix', '')):
+                raise ValueError("Refusing to collect garbage across the remote's whole location, "
+                                 "which other registries may share; set a prefix for this registry "
+                                 "or pass exclusive=True")
+        orphans = self.find_orphans(min_age)
+        if dry_run:
+            return orphans
+        errors = self.remote.delete_many(orphans)
+        if errors:
+            raise TransferError(errors)
+        return orphans
+
+    def _check_writable(self):
+        """
+        Raise a ValueError before deleting from a read-only remote, so that
+        the registry is left unchanged.
+        """
+        if getattr(self.remote, 'read_only', False):
+            raise ValueError("Cannot delete remote objects; the {} is read-only".format(
+                type(self.remote).__name__))
 
     def remove_locals(self):
         """
         Useful for cleaning up before git checkin
         """
-        for entry in self.registry.get_all_entries():
-            if entry.status == 'local':
-                self.remove(entry.name)
+        for entry in self.registry.find_by_status('local'):
+            self.remove(entry.name)
+
+
+def _write_forked(name):
+    """
+    Write one object of a `Filer.dump_many` batch in a forked worker.
+    """
+    filer, objs, codec, out_of_band = _fork_state
+    # (events raised in a worker would never reach the parent's sinks)
+    filer.metrics = []
+    buffer_file = filer._get_buffer_filename(name) if out_of_band else None
+    return filer._write(objs[name], name, codec, buffer_file)
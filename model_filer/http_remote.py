@@ -0,0 +1,294 @@
+"""
+A read-only remote that pulls files from an HTTP(S) server, such as an
+artifact server or a CDN in front of an S3 bucket, without credentials for
+the store behind it.
+
+Only the standard library is used. Connections are kept alive and pooled, so
+that a pull does not pay for a new TCP and TLS handshake per request, and
+large files are fetched as parallel ranged GETs.
+
+ETags only guard ranges and resumed downloads against the object changing
+meanwhile. Complete local copies are never revalidated with the server: the
+filer only downloads files that are missing, and checks local copies against
+their registry digest instead.
+"""
+import http.client
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlsplit
+
+from .fileio import CHUNK_SIZE, DEFAULT_ALGORITHM, format_digest, hash_partial_file, new_hash
+from .remotes import _object_name
+
+# Errors that mean a kept-alive connection was closed by the server meanwhile
+_STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+
+class _ConnectionPool():
+    """
+    Keep-alive connections to one server, created as needed. At most
+    `maxsize` idle connections are kept.
+    """
+    def __init__(self, scheme, netloc, maxsize, timeout):
+        if scheme == 'https':
+            self._connection_class = http.client.HTTPSConnection
+        else:
+            self._connection_class = http.client.HTTPConnection
+        self._netloc = netloc
+        self._maxsize = maxsize
+        self._timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        Return an idle connection, and whether it was used before.
+        """
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self._connection_class(self._netloc, timeout=self._timeout), False
+
+    def put(self, connection):
+        with self._lock:
+            if len(self._idle) < self._maxsize:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+
+class _Response():
+    """
+    A response whose connection goes back to the pool once its body has been
+    read or it is closed.
+    """
+    def __init__(self, response, connection, pool):
+        self._response = response
+        self._connection = connection
+        self._pool = pool
+        self.status = response.status
+
+    def getheader(self, name, default=None):
+        return self._response.getheader(name, default)
+
+    def iter_chunks(self, chunk_size=CHUNK_SIZE):
+        for chunk in iter(lambda: self._response.read(chunk_size), b''):
+            yield chunk
+        self.close()
+
+    def close(self):
+        if self._connection is None:
+            return
+        if not self._response.isclosed() and (self._response.length or 0) <= CHUNK_SIZE:
+            # (a short body, e.g. of an error, is cheaper to read than a new connection)
+            self._response.read()
+        if self._response.isclosed() and not self._response.will_close:
+            self._pool.put(self._connection)
+        else:
+            # (a body left unread would be taken for the next response)
+            self._connection.close()
+        self._connection = None
+
+
+class HTTPRemote():
+    """
+    Parameters
+    ----------
+    remote_specifier : string
+        Base URL that addresses are relative to, e.g.
+        'https://models.example.com/files/'.
+    prefix : string (default '')
+        Prefix of the addresses of objects, as for `S3Remote`.
+    mirror_of : string or None (default None)
+        Remote type whose registry this remote reads, e.g. 's3' to pull the
+        files pushed to an S3 bucket through an HTTP gateway or CDN in front
+        of it. By default the filer uses a registry of its own.
+    part_size : int (default 8MB)
+        Size of the ranges large files are fetched in.
+    max_concurrency : int (default 8)
+        Number of ranges fetched at once.
+    timeout : float (default 60)
+        Seconds to wait for the server on each request.
+    headers : dict or None (default None)
+        Extra headers sent with every request, e.g. for authentication.
+    """
+    # Attempts at resuming a download that fails part way through
+    MAX_RETRIES = 5
+    read_only = True
+
+    def __init__(self, remote_specifier, prefix='', mirror_of=None, part_size=8 * 2 ** 20,
+                 max_concurrency=8, timeout=60.0, headers=None):
+        parts = urlsplit(remote_specifier)
+        if parts.scheme not in ('http', 'https') or not parts.netloc:
+            raise ValueError("Invalid HTTP remote URL: {}".format(remote_specifier))
+        self.base_url = remote_specifier.rstrip('/') + '/'
+        self._base_path = parts.path.rstrip('/') + '/'
+        self.prefix = prefix
+        self.mirror_of = mirror_of
+        self.part_size = part_size
+        self.max_concurrency = max_concurrency
+        self.headers = dict(headers or {})
+        self._pool = _ConnectionPool(parts.scheme, parts.netloc, max(10, max_concurrency), timeout)
+        # ETag of the object each unfinished download was started from
+        self._partial = {}
+        self._partial_lock = threading.Lock()
+
+    def address(self, name, digest=None, extension='.pkl'):
+        return self.prefix + _object_name(name, digest, extension)
+
+    def _relative_url(self, remote_address):
+        if os.path.isabs(remote_address):
+            # (a drive remote's directory served as is)
+            remote_address = os.path.basename(remote_address)
+        return quote(remote_address)
+
+    def url(self, remote_address):
+        return self.base_url + self._relative_url(remote_address)
+
+    def _request(self, method, remote_address, headers=None):
+        """
+        Send a request on a pooled connection and return the `_Response`,
+        retrying once on a fresh connection if a kept-alive one turns out to
+        have been closed by the server.
+        """
+        all_headers = dict(self.headers, **(headers or {}))
+        while True:
+            connection, reused = self._pool.get()
+            try:
+                connection.request(method, self._base_path + self._relative_url(remote_address),
+                                   headers=all_headers)
+                response = connection.getresponse()
+            except _STALE_CONNECTION_ERRORS:
+                connection.close()
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                connection.close()
+                raise
+            return _Response(response, connection, self._pool)
+
+    def _check(self, response, remote_address, *statuses):
+        if response.status in statuses:
+            return
+        response.close()
+        if response.status == 404:
+            raise FileNotFoundError("Remote file '{}' not found".format(self.url(remote_address)))
+        raise OSError("HTTP {} for '{}'".format(response.status, self.url(remote_address)))
+
+    def exists(self, remote_address):
+        response = self._request('HEAD', remote_address)
+        response.close()
+        if response.status == 404:
+            return False
+        self._check(response, remote_address, 200)
+        return True
+
+    def download(self, local_file, remote_address, algorithm=DEFAULT_ALGORITHM):
+        """
+        Append the rest of the object to `local_file`, as for the other remotes.
+
+        If this remote was interrupted part way through downloading the
+        object, the rest is only appended if the object is unchanged (by its
+        ETag). Ranges fetched in parallel are likewise checked against the
+        ETag.
+        """
+        file_hash, offset = hash_partial_file(local_file, algorithm)
+        key = os.path.abspath(local_file)
+        with self._partial_lock:
+            etag = self._partial.get(key)
+        # (the first range also tells the size, and the rest are fetched in parallel)
+        headers = {'Range': 'bytes={}-{}'.format(offset, offset + self.part_size - 1)}
+        if etag and offset:
+            headers['If-Range'] = etag
+        response = self._request('GET', remote_address, headers)
+        if response.status == 416:
+            # (the object is no longer than what is already there)
+            response.close()
+            return format_digest(file_hash)
+        self._check(response, remote_address, 200, 206)
+        etag = response.getheader('ETag')
+        if response.status == 200 and offset:
+            # (the object changed, or ranges are not supported: start over)
+            file_hash, offset = new_hash(algorithm), 0
+            open(local_file, 'wb').close()
+        content_range = response.getheader('Content-Range')
+        if response.status == 206 and content_range:
+            size = int(content_range.rpartition('/')[2])
+        else:
+            size = offset + int(response.getheader('Content-Length', 0))
+        with self._partial_lock:
+            self._partial[key] = etag
+
+        with open(local_file, 'ab') as f:
+            for chunk in response.iter_chunks():
+                f.write(chunk)
+                file_hash.update(chunk)
+            start = f.tell()
+            ranges = [(begin, min(begin + self.part_size, size))
+                      for begin in range(start, size, self.part_size)]
+            if ranges:
+                self._download_ranges(f, file_hash, remote_address, etag, ranges)
+        with self._partial_lock:
+            del self._partial[key]
+        return format_digest(file_hash)
+
+    def _download_ranges(self, f, file_hash, remote_address, etag, ranges):
+        """
+        Fetch ranges in parallel, but write them in order, so the file is
+        always a prefix of the object and at most `max_concurrency` ranges are
+        held in memory.
+        """
+        def write(chunks):
+            for chunk in chunks:
+                f.write(chunk)
+                file_hash.update(chunk)
+
+        with ThreadPoolExecutor(max_workers=max(1, self.max_concurrency)) as executor:
+            pending = deque()
+            try:
+                for start, end in ranges:
+                    pending.append(executor.submit(self._get_range, remote_address, etag, start, end))
+                    if len(pending) >= self.max_concurrency:
+                        write(pending.popleft().result())
+                while pending:
+                    write(pending.popleft().result())
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def _get_range(self, remote_address, etag, start, end):
+        """
+        Fetch bytes `start` to `end` of an object as a list of chunks, resuming
+        the request if the connection drops part way through.
+        """
+        chunks = []
+        failures = 0
+        while start < end:
+            headers = {'Range': 'bytes={}-{}'.format(start, end - 1)}
+            if etag:
+                # (guards against the object changing between ranges)
+                headers['If-Match'] = etag
+            try:
+                response = self._request('GET', remote_address, headers)
+                self._check(response, remote_address, 206)
+                for chunk in response.iter_chunks():
+                    chunks.append(chunk)
+                    start += len(chunk)
+            except (http.client.HTTPException, ConnectionError, TimeoutError):
+                failures += 1
+                if failures > self.MAX_RETRIES:
+                    raise
+                time.sleep(min(2 ** failures, 30))
+        return chunks
+
+    def _read_only(self, *args, **kwargs):
+        raise NotImplementedError("HTTP remotes are read-only")
+
+    upload = put = open_writer = move = delete = delete_many = _read_only
+
+    def list_addresses(self):
+        raise NotImplementedError("HTTP remotes cannot list their objects")
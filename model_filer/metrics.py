@@ -0,0 +1,190 @@
+"""
+Timing instrumentation for `Filer`.
+
+A metrics sink is any callable accepting an `Event`. Each event reports one
+phase of an operation on one stored object: 'registry' (lookup), 'serialize',
+'write', 'upload', 'download', 'read' and 'deserialize'. Serialization and
+disk I/O are interleaved when streaming, so 'write' and 'read' count only the
+time spent inside file calls and 'serialize'/'deserialize' count the rest.
+"""
+import math
+import random
+import threading
+import time
+from collections import namedtuple
+
+Event = namedtuple('Event', ['phase', 'name', 'seconds', 'nbytes', 'ok'])
+
+
+class PhaseTimer():
+    """
+    Context manager that times a phase and sends an `Event` to every sink on
+    exit. Set `nbytes` inside the block to report a byte count.
+    """
+    __slots__ = ('sinks', 'phase', 'name', 'nbytes', '_start')
+
+    def __init__(self, sinks, phase, name):
+        self.sinks = sinks
+        self.phase = phase
+        self.name = name
+        self.nbytes = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        emit(self.sinks, self.phase, self.name, time.perf_counter() - self._start,
+             self.nbytes, exc_type is None)
+        return False
+
+
+class _NullTimer():
+    """
+    Stand-in for `PhaseTimer` when no sinks are installed.
+    """
+    nbytes = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_TIMER = _NullTimer()
+
+
+def emit(sinks, phase, name, seconds, nbytes=None, ok=True):
+    event = Event(phase, name, seconds, nbytes, ok)
+    for sink in sinks:
+        sink(event)
+
+
+class TimedFile():
+    """
+    Wrap a binary file object and add up the time spent in its read and write
+    calls. Everything else is passed through to the file.
+    """
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self.seconds = 0.0
+        self.nbytes = 0
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        result = method(*args)
+        self.seconds += time.perf_counter() - start
+        return result
+
+    def write(self, data):
+        self.nbytes += len(data)
+        return self._timed(self._fileobj.write, data)
+
+    def read(self, *args):
+        data = self._timed(self._fileobj.read, *args)
+        self.nbytes += len(data)
+        return data
+
+    def readline(self, *args):
+        data = self._timed(self._fileobj.readline, *args)
+        self.nbytes += len(data)
+        return data
+
+    def readinto(self, buffer):
+        count = self._timed(self._fileobj.readinto, buffer)
+        self.nbytes += count or 0
+        return count
+
+    def __getattr__(self, attr):
+        return getattr(self._fileobj, attr)
+
+
+def percentile(values, q):
+    """
+    Nearest-rank percentile of a non-empty list, for `q` between 0 and 100.
+    """
+    ordered = sorted(values)
+    rank = math.ceil(q / 100.0 * len(ordered)) - 1
+    return ordered[max(0, rank)]
+
+
+class _PhaseStats():
+    """
+    Running statistics of the durations of one phase, with a uniform random
+    sample of them (reservoir sampling) for percentiles.
+    """
+    __slots__ = ('count', 'errors', 'total_seconds', 'total_bytes', 'min', 'max', 'sample')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.total_bytes = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sample = []
+
+    def add(self, seconds, nbytes, ok, size, rng):
+        self.count += 1
+        if not ok:
+            self.errors += 1
+        self.total_seconds += seconds
+        self.total_bytes += nbytes or 0
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        if len(self.sample) < size:
+            self.sample.append(seconds)
+        else:
+            index = rng.randrange(self.count)
+            if index < size:
+                self.sample[index] = seconds
+
+
+class MetricsAggregator():
+    """
+    A metrics sink that collects events and reports per-phase percentiles.
+
+    Memory use is bounded: each phase keeps running totals and a random
+    sample of at most `sample_size` durations, from which percentiles are
+    estimated (exactly, until a phase has more events than that).
+
+    Example
+    -------
+    >>> metrics = MetricsAggregator()
+    >>> filer = Filer(local_dir, remote_address, metrics=metrics)
+    >>> filer.load('my_model')
+    >>> metrics.summary()['deserialize']['p99']
+    """
+    def __init__(self, sample_size=1024):
+        self.sample_size = sample_size
+        self._phases = {}
+        self._random = random.Random()
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        with self._lock:
+            stats = self._phases.get(event.phase)
+            if stats is None:
+                stats = self._phases[event.phase] = _PhaseStats()
+            stats.add(event.seconds, event.nbytes, event.ok, self.sample_size, self._random)
+
+    def summary(self):
+        """
+        Return a dict mapping each phase seen so far to its count, error
+        count, p50, p99, min, max and total seconds, and total bytes.
+        """
+        with self._lock:
+            return {phase: {'count': stats.count,
+                            'errors': stats.errors,
+                            'p50': percentile(stats.sample, 50),
+                            'p99': percentile(stats.sample, 99),
+                            'min': stats.min,
+                            'max': stats.max,
+                            'total_seconds': stats.total_seconds,
+                            'total_bytes': stats.total_bytes}
+                    for phase, stats in self._phases.items()}
+
+    def reset(self):
+        with self._lock:
+            self._phases.clear()
@@ -1,18 +1,37 @@
 import csv
 import os
+import threading
+
+from .fileio import atomic_path
 
 # CSV parameters
 DELIMITER = '\t'
 QUOTECHAR = '|'
+# (timestamps in this format sort in time order as strings)
+TIMESTAMP_FORMAT = '%Y-%m-%d::%H:%M:%S'
+
+
+def format_timestamp(value):
+    """
+    Return a datetime as a registry timestamp; strings and None are returned
+    unchanged.
+    """
+    if hasattr(value, 'strftime'):
+        return value.strftime(TIMESTAMP_FORMAT)
+    return value
 
 
 class Registry():
     """
     This class is in charge of writing/reading from the registry file.
 
-    No overwriting/changing is allowed. If something needs to be altered, the
-    client code should delete an entry and make a new one by calling
-    appropriate methods here.
+    The file is parsed once into an in-memory index of raw rows keyed by name,
+    and is only re-read when its inode, size or modification time changes on
+    disk. A `RegistryEntry` is only built once a query returns its row, and is
+    then kept until the file changes. Adding an entry appends a single row; any
+    other mutation rewrites the file to a temporary sibling which is then
+    atomically renamed over the original. All methods are safe to call from
+    several threads of one process.
 
     Parameters
     ----------
@@ -21,52 +40,244 @@ class Registry():
     """
     def __init__(self, registry_file):
         if not os.path.exists(registry_file):
-            open(registry_file, 'w')
+            open(registry_file, 'w').close()
         self.registry_file = registry_file
+        self._rows = {}
+        # entries built so far, from the rows of the current index
+        self._built = {}
+        # names by digest, indexed on first use
+        self._digests = None
+        self._stamp = None
+        self._lock = threading.RLock()
 
-    def get_all_entries(self):
-        with open(self.registry_file, 'r') as f:
+    def _file_stamp(self):
+        stat = os.stat(self.registry_file)
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def _refresh(self):
+        """
+        Re-read the registry file if it changed since it was last indexed.
+        """
+        stamp = self._file_stamp()
+        if stamp == self._stamp:
+            return
+        with open(self.registry_file, 'r', newline='') as f:
             reader = csv.reader(f, delimiter=DELIMITER, quotechar=QUOTECHAR)
-            return [RegistryEntry(*row) for row in reader]
+            self._rows = {row[0]: tuple(row) for row in reader if row}
+        self._built = {}
+        self._digests = None
+        self._stamp = stamp
 
-    def find_by_name(self, name):
-        entries = self.get_all_entries()
-        for entry in entries:
-            if entry.name == name:
-                return entry
-
-    def add_entry(self, name, status, address, timestamp):
-        if self.find_by_name(name):
-            raise ValueError("Cannot add '{}' to registry; it is already there.")
-        entry = RegistryEntry(name=name, status=status,
-                              address=address, timestamp=timestamp)
-        with open(self.registry_file, 'a') as f:
-            writer = csv.writer(f, delimiter=DELIMITER, quotechar=QUOTECHAR)
-            writer.writerow(entry.to_list())
+    def _write_all(self, rows):
+        """
+        Replace the registry file with `rows` via temp-file-and-rename.
+        """
+        rows = list(rows)
+        with atomic_path(self.registry_file) as tmp_file:
+            with open(tmp_file, 'w', newline='') as f:
+                writer = csv.writer(f, delimiter=DELIMITER, quotechar=QUOTECHAR)
+                writer.writerows(rows)
+        self._rows = {row[0]: row for row in rows}
+        self._built = {}
+        self._digests = None
+        self._stamp = self._file_stamp()
 
-    def remove_entry(self, name):
-        removed_entry = self.find_by_name(name)
-        if not removed_entry:
-            raise ValueError("Cannot remove '{}' from registry; it is not there.")
-        entries = self.get_all_entries()
-        with open(self.registry_file, 'w') as f:
+    def _append(self, entries):
+        rows = [tuple(entry.to_list()) for entry in entries]
+        with open(self.registry_file, 'a', newline='') as f:
             writer = csv.writer(f, delimiter=DELIMITER, quotechar=QUOTECHAR)
+            writer.writerows(rows)
+        self._rows.update((row[0], row) for row in rows)
+        self._built.update((entry.name, entry) for entry in entries)
+        if self._digests is not None:
             for entry in entries:
-                if entry.name != name:
-                    writer.writerow(entry.to_list())
-        return removed_entry
+                if entry.digest:
+                    self._digests.setdefault(entry.digest, []).append(entry.name)
+        self._stamp = self._file_stamp()
+
+    def iter_entries(self, status=None, prefix=None, since=None, until=None):
+        """
+        Yield entries in registry order, one at a time.
+
+        Parameters
+        ----------
+        status : string or None
+            Only yield entries with this status.
+        prefix : string or None
+            Only yield entries whose name starts with this.
+        since, until : string, datetime or None
+            Only yield entries with a timestamp at or after `since` and before
+            `until`.
+
+        Rows are filtered before entries are built from them. Changes made to
+        the registry during the iteration are not seen by it.
+        """
+        since, until = format_timestamp(since), format_timestamp(until)
+        with self._lock:
+            self._refresh()
+            rows, built = list(self._rows.values()), self._built
+        if status is not None:
+            rows = [row for row in rows if row[1] == status]
+        if prefix:
+            rows = [row for row in rows if row[0].startswith(prefix)]
+        if since is not None:
+            rows = [row for row in rows if row[3] >= since]
+        if until is not None:
+            rows = [row for row in rows if row[3] < until]
+        for row in rows:
+            yield built.get(row[0]) or _build(built, row)
+
+    def get_all_entries(self):
+        return list(self.iter_entries())
+
+    def find_by_name(self, name):
+        with self._lock:
+            self._refresh()
+            row = self._rows.get(name)
+            return _build(self._built, row) if row else None
+
+    def find_by_status(self, status):
+        return list(self.iter_entries(status=status))
+
+    def find_by_digest(self, digest):
+        """
+        Return the entries with a given digest, in registry order.
+        """
+        with self._lock:
+            self._refresh()
+            if self._digests is None:
+                self._digests = {}
+                for row in self._rows.values():
+                    if len(row) > 5 and row[5]:
+                        self._digests.setdefault(row[5], []).append(row[0])
+            return [_build(self._built, self._rows[name]) for name in self._digests.get(digest, ())]
+
+    def add_entry(self, name, status, address, timestamp, **fields):
+        with self._lock:
+            if self.find_by_name(name):
+                raise ValueError("Cannot add '{}' to registry; it is already there.".format(name))
+            entry = RegistryEntry(name=name, status=status,
+                                  address=address, timestamp=timestamp, **fields)
+            self._append([entry])
+            return entry
+
+    def update_entry(self, name, **changes):
+        """
+        Replace fields of an existing entry in place, keeping its position in
+        the file. Returns the new entry.
+        """
+        return self.update_entries({name: changes})[name]
+
+    def update_entries(self, changes):
+        """
+        Apply several in-place updates with a single write of the file.
+
+        Parameters
+        ----------
+        changes : dict
+            Maps each name to a dict of the fields to change for that entry.
+
+        Returns a dict mapping each name to its new entry.
+        """
+        with self._lock:
+            self._refresh()
+            missing = [name for name in changes if name not in self._rows]
+            if missing:
+                raise ValueError("Cannot update '{}' in registry; it is not there.".format(missing[0]))
+            if not changes:
+                return {}
+            updated = {name: _build(self._built, self._rows[name]).replace(**fields)
+                       for name, fields in changes.items()}
+            self._write_all(tuple(updated[name].to_list()) if name in updated else row
+                            for name, row in self._rows.items())
+            return updated
+
+    def put_entries(self, entries):
+        """
+        Add several entries with a single write of the file. An entry whose
+        name is already registered replaces the existing one in place.
+        """
+        with self._lock:
+            self._refresh()
+            if not any(entry.name in self._rows for entry in entries):
+                # (new entries only need appending)
+                self._append(entries)
+                return
+            merged = dict(self._rows)
+            merged.update((entry.name, tuple(entry.to_list())) for entry in entries)
+            self._write_all(merged.values())
+
+    def remove_entry(self, name):
+        return self.remove_entries([name])[0]
+
+    def remove_entries(self, names):
+        """
+        Remove several entries with a single write of the file. Returns the
+        removed entries.
+        """
+        with self._lock:
+            self._refresh()
+            missing = [name for name in names if name not in self._rows]
+            if missing:
+                raise ValueError("Cannot remove '{}' from registry; it is not there.".format(missing[0]))
+            names = set(names)
+            removed = [_build(self._built, row) for name, row in self._rows.items() if name in names]
+            if removed:
+                self._write_all(row for name, row in self._rows.items() if name not in names)
+            return removed
+
+
+def _build(built, row):
+    """
+    Return the entry for an index row, building it if it is not in `built`.
+    """
+    entry = built.get(row[0])
+    if entry is None:
+        entry = built[row[0]] = RegistryEntry(*row)
+    return entry
 
 
 class RegistryEntry():
-    def __init__(self, name, status, address, timestamp):
+    # Columns after the first four are optional. Empty ones are left off the
+    # end of the row, so older registry files read and write back unchanged.
+    FIELDS = ('name', 'status', 'address', 'timestamp', 'codec', 'digest', 'layout')
+    REQUIRED_FIELDS = 4
+    # (no per-entry __dict__, as registries can hold many thousands of entries)
+    __slots__ = FIELDS
+
+    def __init__(self, name, status, address, timestamp, codec=None, digest=None,
+                 layout=None):
         self.name = name
         self.status = status
         self.address = address
         self.timestamp = timestamp
+        self.codec = codec or None
+        self.digest = digest or None
+        self.layout = layout or None
         self._validate()
 
     def _validate(self):
         assert self.status in ('local', 'synced')
+        assert self.layout in (None, 'oob') or self.sharded
+
+    @property
+    def sharded(self):
+        return bool(self.layout) and self.layout.startswith('shards:')
+
+    @property
+    def shard_count(self):
+        return int(self.layout.split(':')[1]) if self.sharded else 0
+
+    def replace(self, **changes):
+        """
+        Return a copy of this entry with some fields changed.
+        """
+        fields = {field: getattr(self, field) for field in self.FIELDS}
+        fields.update(changes)
+        return RegistryEntry(**fields)
 
     def to_list(self):
-        return [self.name, self.status, self.address, self.timestamp]
+        row = [getattr(self, field) for field in self.FIELDS]
+        while len(row) > self.REQUIRED_FIELDS and not row[-1]:
+            row.pop()
+        return row
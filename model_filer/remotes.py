@@ -1,12 +1,119 @@
 """
 A remote is an object capable writing and reading from a remote location.
 Each should have an identical API.
+
+Uploads are normally stored under a new unique name. When a digest is passed
+to `upload`, the object is instead stored under a name derived from the
+digest, and the upload is skipped if that object already exists. `put`
+stores a file at an explicit address, e.g. next to an uploaded object.
+
+`download` appends to whatever is already in the local file, so that an
+interrupted download can be resumed by calling it again, and returns the
+digest of the complete file. Callers are expected to download to a temporary
+path and move the file into place once its digest has been checked.
+
+`open_writer` returns a context manager for a binary file-like object that
+writes straight to a remote address, so an object can be serialized into the
+remote without a local copy. The object only appears once the block exits
+without an error. `address` returns the address `upload` would use (or,
+given an extension, the address of another kind of object),
+`move` renames an object within the remote, and `url` returns a string that
+identifies an address across remotes.
+
+`list_addresses` returns every object in the remote's location with its
+modification time, in as few requests as the remote allows, and
+`delete_many` deletes a batch of objects, returning a dict of the addresses
+that could not be deleted with their exceptions. A remote that can only be
+read from sets `read_only = True`, and raises NotImplementedError from the
+other methods.
+
+Remote types are looked up by name in `REMOTE_TYPES`, then among the
+'model_filer.remotes' entry points of installed packages, so that a package
+can provide a new remote type by declaring e.g.
+    entry_points={'model_filer.remotes': ['gcs = my_package.gcs:GCSRemote']}
+in its setup.py, or by calling `register_remote_type`. The built-in types are
+given as import paths, so that a remote's module (and its dependencies, such
+as boto3) is only imported once that remote type is used. `S3Remote` can
+still be imported from here, and is then imported from `model_filer.s3`.
 """
+import importlib
 import os
 import shutil
+from contextlib import contextmanager
 from uuid import uuid4
 
-import boto3
+from .fileio import CHUNK_SIZE, DEFAULT_ALGORITHM, atomic_path, format_digest, hash_partial_file
+
+ENTRY_POINT_GROUP = 'model_filer.remotes'
+
+# Maps each remote type to its class, or to the 'module:class' path of it
+REMOTE_TYPES = {
+    'drive': 'model_filer.remotes:DriveRemote',
+    's3': 'model_filer.s3:S3Remote',
+    'http': 'model_filer.http_remote:HTTPRemote',
+}
+
+
+def register_remote_type(remote_type, remote_class):
+    """
+    Make `Filer(..., remote_type=remote_type)` use `remote_class`, which is
+    called with the remote connection and any `remote_options`.
+    """
+    REMOTE_TYPES[remote_type] = remote_class
+
+
+def get_remote_type(remote_type):
+    """
+    Return the class registered for a remote type, importing it if needed.
+    """
+    remote_class = REMOTE_TYPES.get(remote_type)
+    if remote_class is None:
+        remote_class = _find_entry_point(remote_type)
+    if remote_class is None:
+        raise ValueError("Unsupported remote type: {}".format(remote_type))
+    if isinstance(remote_class, str):
+        module_name, _, class_name = remote_class.partition(':')
+        remote_class = getattr(importlib.import_module(module_name), class_name)
+        REMOTE_TYPES[remote_type] = remote_class
+    return remote_class
+
+
+# Names that moved out of this module, with the modules they moved to
+_MOVED = {
+    'S3Remote': 'model_filer.s3',
+    'get_s3_client': 'model_filer.s3',
+}
+
+
+def __getattr__(name):
+    """
+    Import the names that moved out of this module on first access, so that
+    existing imports of them keep working without importing boto3 up front.
+    """
+    if name in _MOVED:
+        return getattr(importlib.import_module(_MOVED[name]), name)
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
+
+
+def _find_entry_point(remote_type):
+    # (deferred, since reading package metadata is slow and rarely needed)
+    from importlib.metadata import entry_points
+    found = entry_points()
+    if hasattr(found, 'select'):
+        found = found.select(group=ENTRY_POINT_GROUP)
+    else:  # (Python < 3.10)
+        found = found.get(ENTRY_POINT_GROUP, [])
+    for entry_point in found:
+        if entry_point.name == remote_type:
+            return entry_point.load()
+    return None
+
+
+def _object_name(name, digest=None, extension='.pkl'):
+    if digest:
+        return digest.replace(':', '_') + extension
+    return name + '_' + str(uuid4()) + extension
+
 
 class DriveRemote():
     def __init__(self, remote_specifier):
@@ -15,34 +122,60 @@ class DriveRemote():
         if not os.path.isdir(self.path):
             raise FileNotFoundError("Local path '{}' is not a valid directory".format(self.path))
 
-    def upload(self, name, local_file):
-        unique_name = name + '_' + str(uuid4()) + '.pkl'
-        remote_address = os.path.join(self.path, unique_name)
-        shutil.copyfile(local_file, remote_address)
+    def address(self, name, digest=None, extension='.pkl'):
+        return os.path.join(self.path, _object_name(name, digest, extension))
+
+    def upload(self, name, local_file, digest=None):
+        remote_address = self.address(name, digest)
+        if not (digest and self.exists(remote_address)):
+            self.put(local_file, remote_address)
         return remote_address
 
-    def download(self, local_file, remote_address):
-        shutil.copyfile(remote_address, local_file)
+    def put(self, local_file, remote_address):
+        # (a half-copied file must never be visible under its final name)
+        with atomic_path(remote_address) as tmp_address:
+            shutil.copyfile(local_file, tmp_address)
 
-    def delete(self, remote_address):
-        os.remove(remote_address)
+    @contextmanager
+    def open_writer(self, remote_address):
+        with atomic_path(remote_address) as tmp_address:
+            with open(tmp_address, 'wb') as f:
+                yield f
 
+    def move(self, remote_address, new_address):
+        os.replace(remote_address, new_address)
 
-class S3Remote():
-    def __init__(self, remote_specifier=None):
-        # Here, the specifier is a path to an AWS creds file
-        if remote_specifier is None:
-            remote_specifier = '~/.aws/credentials'
-        os.environ["AWS_SHARED_CREDENTIALS_FILE"] = remote_specifier
-        self.s3_client = boto3.client('s3')
+    def url(self, remote_address):
+        return 'file://' + os.path.abspath(remote_address)
 
-    def upload(self, name, local_file):
-        unique_name = name + '_' + str(uuid4()) + '.pkl'
-        self.s3_client.upload_file(local_file, 'ds-model-files', unique_name)
-        return unique_name
+    def exists(self, remote_address):
+        return os.path.isfile(remote_address)
 
-    def download(self, local_file, remote_address):
-        self.s3_client.download_file('ds-model-files', remote_address, local_file)
+    def download(self, local_file, remote_address, algorithm=DEFAULT_ALGORITHM):
+        file_hash, offset = hash_partial_file(local_file, algorithm)
+        with open(remote_address, 'rb') as src, open(local_file, 'ab') as dst:
+            src.seek(offset)
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                dst.write(chunk)
+                file_hash.update(chunk)
+        return format_digest(file_hash)
 
     def delete(self, remote_address):
-        self.s3_client.delete_object(Bucket='ds-model-files', Key=remote_address)
+        os.remove(remote_address)
+
+    def list_addresses(self):
+        with os.scandir(self.path) as entries:
+            # (skipping the temporary files of writes in progress)
+            return {os.path.join(self.path, entry.name): entry.stat().st_mtime
+                    for entry in entries if entry.is_file() and not entry.name.endswith('.tmp')}
+
+    def delete_many(self, remote_addresses):
+        errors = {}
+        for remote_address in remote_addresses:
+            try:
+                os.remove(remote_address)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                errors[remote_address] = e
+        return errors
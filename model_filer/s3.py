@@ -0,0 +1,319 @@
+"""
+The S3 remote. It lives in its own module, which is only imported when an
+S3 remote is first used, because importing boto3 is slow.
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import boto3
+import botocore.session
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+
+from .fileio import CHUNK_SIZE, DEFAULT_ALGORITHM, format_digest, hash_partial_file
+from .remotes import _object_name
+
+
+_s3_clients = {}
+_s3_clients_lock = threading.Lock()
+
+
+def get_s3_client(credentials_file=None, region_name=None, endpoint_url=None,
+                  max_pool_connections=10):
+    """
+    Return an S3 client for the given settings, creating it on first use.
+
+    Clients are thread-safe and expensive to create, so a single client (and
+    its pool of keep-alive connections) is shared by every `S3Remote` in the
+    process that uses the same settings.
+    """
+    key = (credentials_file, region_name, endpoint_url, max_pool_connections)
+    with _s3_clients_lock:
+        client = _s3_clients.get(key)
+        if client is None:
+            core_session = botocore.session.Session()
+            if credentials_file:
+                core_session.set_config_variable('credentials_file',
+                                                 os.path.expanduser(credentials_file))
+            session = boto3.session.Session(botocore_session=core_session)
+            client = session.client('s3', region_name=region_name, endpoint_url=endpoint_url,
+                                    config=Config(max_pool_connections=max_pool_connections))
+            _s3_clients[key] = client
+        return client
+
+
+class _Throttle():
+    """
+    Sleep as needed to keep a transfer under `max_bandwidth` bytes per second.
+    """
+    def __init__(self, max_bandwidth):
+        self.max_bandwidth = max_bandwidth
+        self._start = time.monotonic()
+        self._nbytes = 0
+
+    def consume(self, nbytes):
+        if self.max_bandwidth:
+            self._nbytes += nbytes
+            delay = self._nbytes / self.max_bandwidth - (time.monotonic() - self._start)
+            if delay > 0:
+                time.sleep(delay)
+
+
+class _MultipartWriter():
+    """
+    Binary file-like object that streams what is written to it into an S3
+    multipart upload. Parts are uploaded in the background, and at most
+    `max_concurrency` + 1 parts are held in memory at a time.
+    """
+    # S3 rejects smaller parts (except the last)
+    MIN_PART_SIZE = 5 * 2 ** 20
+
+    def __init__(self, remote, remote_address):
+        self._client = remote.s3_client
+        self._bucket = remote.bucket
+        self._key = remote_address
+        config = remote.transfer_config
+        self._part_size = max(config.multipart_chunksize, self.MIN_PART_SIZE)
+        self._workers = config.max_concurrency if config.use_threads else 1
+        self._throttle = _Throttle(config.max_bandwidth)
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._executor = None
+        self._parts = []
+        self._pending = deque()
+
+    def write(self, data):
+        view = memoryview(data).cast('B')
+        while view:
+            count = min(self._part_size - len(self._buffer), len(view))
+            self._buffer += view[:count]
+            view = view[count:]
+            if len(self._buffer) == self._part_size:
+                self._submit()
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def _submit(self):
+        if self._upload_id is None:
+            self._upload_id = self._client.create_multipart_upload(
+                Bucket=self._bucket, Key=self._key)['UploadId']
+            self._executor = ThreadPoolExecutor(max_workers=self._workers)
+        while len(self._pending) >= self._workers:
+            self._pending.popleft().result()
+        future = self._executor.submit(self._upload_part, len(self._parts) + 1,
+                                       bytes(self._buffer))
+        self._parts.append(future)
+        self._pending.append(future)
+        self._buffer = bytearray()
+
+    def _upload_part(self, number, body):
+        self._throttle.consume(len(body))
+        response = self._client.upload_part(Bucket=self._bucket, Key=self._key, PartNumber=number,
+                                            UploadId=self._upload_id, Body=body)
+        return {'PartNumber': number, 'ETag': response['ETag']}
+
+    def complete(self):
+        if self._upload_id is None:
+            # (small enough for a single request)
+            self._client.put_object(Bucket=self._bucket, Key=self._key, Body=bytes(self._buffer))
+            return
+        if self._buffer:
+            self._submit()
+        parts = [future.result() for future in self._parts]
+        self._executor.shutdown()
+        self._client.complete_multipart_upload(Bucket=self._bucket, Key=self._key,
+                                               UploadId=self._upload_id,
+                                               MultipartUpload={'Parts': parts})
+
+    def abort(self):
+        if self._upload_id is None:
+            return
+        for future in self._parts:
+            future.cancel()
+        self._executor.shutdown()
+        self._client.abort_multipart_upload(Bucket=self._bucket, Key=self._key,
+                                            UploadId=self._upload_id)
+
+
+class S3Remote():
+    """
+    Parameters
+    ----------
+    remote_specifier : string or None
+        Path to an AWS credentials file, or None for boto3's usual lookup.
+    bucket : string (default 'ds-model-files')
+        Bucket to store objects in.
+    prefix : string (default '')
+        Prefix for the keys of new objects, e.g. 'team/models/'. Registered
+        addresses include it, so changing it later does not break them.
+    transfer_config : boto3.s3.transfer.TransferConfig, dict or None
+        Part size (`multipart_chunksize`), parallelism (`max_concurrency`)
+        and bandwidth cap (`max_bandwidth`, in bytes per second) for uploads
+        and downloads. A dict is passed to `TransferConfig`.
+    region_name, endpoint_url : string or None
+        Passed to the client, e.g. for S3-compatible stores.
+    """
+    # Attempts at resuming a download that fails part way through
+    MAX_RETRIES = 5
+    # Most keys S3 accepts in one DeleteObjects request
+    DELETE_BATCH_SIZE = 1000
+
+    def __init__(self, remote_specifier=None, bucket='ds-model-files', prefix='',
+                 transfer_config=None, region_name=None, endpoint_url=None):
+        if isinstance(transfer_config, dict):
+            transfer_config = TransferConfig(**transfer_config)
+        self.transfer_config = transfer_config or TransferConfig()
+        self.bucket = bucket
+        self.prefix = prefix
+        # (enough connections for every part of a transfer to run at once)
+        self._client_settings = (remote_specifier, region_name, endpoint_url,
+                                 max(10, self.transfer_config.max_concurrency))
+        self._s3_client = None
+
+    @property
+    def s3_client(self):
+        """
+        The client, fetched from the pool on first use so that creating a
+        remote that is never used costs nothing.
+        """
+        if self._s3_client is None:
+            self._s3_client = get_s3_client(*self._client_settings)
+        return self._s3_client
+
+    @s3_client.setter
+    def s3_client(self, client):
+        self._s3_client = client
+
+    def address(self, name, digest=None, extension='.pkl'):
+        return self.prefix + _object_name(name, digest, extension)
+
+    def upload(self, name, local_file, digest=None):
+        remote_address = self.address(name, digest)
+        if not (digest and self.exists(remote_address)):
+            self.put(local_file, remote_address)
+        return remote_address
+
+    def put(self, local_file, remote_address):
+        self.s3_client.upload_file(local_file, self.bucket, remote_address,
+                                   Config=self.transfer_config)
+
+    @contextmanager
+    def open_writer(self, remote_address):
+        writer = _MultipartWriter(self, remote_address)
+        try:
+            yield writer
+            writer.complete()
+        except BaseException:
+            writer.abort()
+            raise
+
+    def move(self, remote_address, new_address):
+        self.s3_client.copy({'Bucket': self.bucket, 'Key': remote_address}, self.bucket,
+                            new_address, Config=self.transfer_config)
+        self.delete(remote_address)
+
+    def url(self, remote_address):
+        return 's3://{}/{}'.format(self.bucket, remote_address)
+
+    def exists(self, remote_address):
+        try:
+            self.s3_client.head_object(Bucket=self.bucket, Key=remote_address)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+        return True
+
+    def download(self, local_file, remote_address, algorithm=DEFAULT_ALGORITHM):
+        file_hash, offset = hash_partial_file(local_file, algorithm)
+        head = self.s3_client.head_object(Bucket=self.bucket, Key=remote_address)
+        size = head['ContentLength']
+        part_size = self.transfer_config.multipart_chunksize
+        ranges = [(start, min(start + part_size, size)) for start in range(offset, size, part_size)]
+        workers = self.transfer_config.max_concurrency if self.transfer_config.use_threads else 1
+        throttle = _Throttle(self.transfer_config.max_bandwidth)
+
+        def write(chunks):
+            for chunk in chunks:
+                f.write(chunk)
+                file_hash.update(chunk)
+                throttle.consume(len(chunk))
+
+        with open(local_file, 'ab') as f:
+            if workers <= 1 or len(ranges) <= 1:
+                for start, end in ranges:
+                    write(self._get_range(remote_address, head['ETag'], start, end))
+            else:
+                # Parts are fetched in parallel but written in order, so the
+                # file is always a prefix of the object (and can be resumed),
+                # and at most `workers` parts are held in memory at once.
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    pending = deque()
+                    try:
+                        for start, end in ranges:
+                            pending.append(executor.submit(
+                                self._get_range, remote_address, head['ETag'], start, end))
+                            if len(pending) >= workers:
+                                write(pending.popleft().result())
+                        while pending:
+                            write(pending.popleft().result())
+                    finally:
+                        for future in pending:
+                            future.cancel()
+        return format_digest(file_hash)
+
+    def _get_range(self, remote_address, etag, start, end):
+        """
+        Fetch bytes `start` to `end` of an object as a list of chunks, resuming
+        the request if the connection drops part way through.
+        """
+        chunks = []
+        failures = 0
+        while start < end:
+            try:
+                # (If-Match guards against the object changing between ranges)
+                response = self.s3_client.get_object(
+                    Bucket=self.bucket, Key=remote_address, IfMatch=etag,
+                    Range='bytes={}-{}'.format(start, end - 1))
+                for chunk in response['Body'].iter_chunks(CHUNK_SIZE):
+                    chunks.append(chunk)
+                    start += len(chunk)
+            except (BotoCoreError, OSError):
+                failures += 1
+                if failures > self.MAX_RETRIES:
+                    raise
+                time.sleep(min(2 ** failures, 30))
+        return chunks
+
+    def delete(self, remote_address):
+        self.s3_client.delete_object(Bucket=self.bucket, Key=remote_address)
+
+    def list_addresses(self):
+        addresses = {}
+        kwargs = {'Bucket': self.bucket, 'Prefix': self.prefix}
+        while True:
+            response = self.s3_client.list_objects_v2(**kwargs)
+            for obj in response.get('Contents', []):
+                addresses[obj['Key']] = obj['LastModified'].timestamp()
+            if not response.get('IsTruncated'):
+                return addresses
+            kwargs['ContinuationToken'] = response['NextContinuationToken']
+
+    def delete_many(self, remote_addresses):
+        remote_addresses = list(remote_addresses)
+        errors = {}
+        for start in range(0, len(remote_addresses), self.DELETE_BATCH_SIZE):
+            batch = remote_addresses[start:start + self.DELETE_BATCH_SIZE]
+            response = self.s3_client.delete_objects(
+                Bucket=self.bucket,
+                Delete={'Objects': [{'Key': address} for address in batch], 'Quiet': True})
+            for error in response.get('Errors', []):
+                errors[error['Key']] = ClientError({'Error': error}, 'DeleteObjects')
+        return errors
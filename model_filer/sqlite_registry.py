@@ -0,0 +1,245 @@
+import csv
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+
+from .fileio import atomic_path
+from .registry import DELIMITER, QUOTECHAR, RegistryEntry, format_timestamp
+
+
+class SQLiteRegistry():
+    """
+    A registry stored in an SQLite database in WAL mode, with the same API as
+    `Registry`.
+
+    Any number of threads and processes can read and write the same database
+    concurrently: each mutation is a single transaction, and lookups by name
+    and status use indexes instead of scanning the whole registry.
+
+    The database is a local working copy and should not be checked into git.
+    The git-tracked TSV registry is imported once, when the database is first
+    created, and `export_tsv` writes the current state back to it.
+
+    Parameters
+    ----------
+    db_file : string
+        Path to the database file.
+    tsv_file : string or None
+        Path to the TSV registry file to import from and export to.
+    timeout : float
+        Seconds to wait for another writer to release its lock.
+    """
+    # Rows read at a time by `iter_entries`
+    PAGE_SIZE = 1000
+
+    def __init__(self, db_file, tsv_file=None, timeout=30.0):
+        self.db_file = db_file
+        self.tsv_file = tsv_file
+        self.timeout = timeout
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        with self._transaction() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS entries ('
+                         'position INTEGER PRIMARY KEY AUTOINCREMENT, '
+                         'name TEXT NOT NULL UNIQUE)')
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(entries)')}
+            # (columns are added as RegistryEntry gains fields)
+            for field in RegistryEntry.FIELDS:
+                if field not in columns:
+                    conn.execute('ALTER TABLE entries ADD COLUMN {} TEXT'.format(field))
+            conn.execute('CREATE INDEX IF NOT EXISTS entries_status ON entries (status)')
+            conn.execute('CREATE INDEX IF NOT EXISTS entries_digest ON entries (digest)')
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            # (seeded once, in the transaction that finds it unseeded, so that
+            # neither a later emptied database nor a concurrent opener imports again)
+            seeded = conn.execute("SELECT 1 FROM meta WHERE key = 'seeded'").fetchone()
+            if not seeded:
+                empty = conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0] == 0
+                if empty and tsv_file and os.path.exists(tsv_file):
+                    self._import(conn, tsv_file)
+                conn.execute("INSERT INTO meta (key, value) VALUES ('seeded', '1')")
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=self.timeout, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Run a block as one write transaction, taking the write lock up front
+        so that reads within the block cannot be invalidated by other writers.
+        """
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _select(self, where='', params=()):
+        query = 'SELECT {} FROM entries {} ORDER BY position'.format(
+            ', '.join(RegistryEntry.FIELDS), where)
+        return [RegistryEntry(*row) for row in self._connection().execute(query, params)]
+
+    def iter_entries(self, status=None, prefix=None, since=None, until=None):
+        """
+        Yield entries in registry order, one at a time, filtered as for
+        `Registry.iter_entries`.
+
+        The filters are applied by SQLite, using the indexes on name and
+        status, and rows are read in pages so that no query stays open while
+        the caller works through them.
+        """
+        conditions, params = ['position > ?'], []
+        if status is not None:
+            conditions.append('status = ?')
+            params.append(status)
+        if prefix:
+            # (a range of names, which can use the index on name)
+            conditions.append('name >= ?')
+            params.append(prefix)
+            if prefix[-1] < chr(sys.maxunicode):
+                conditions.append('name < ?')
+                params.append(prefix[:-1] + chr(ord(prefix[-1]) + 1))
+        for condition, bound in (('timestamp >= ?', since), ('timestamp < ?', until)):
+            if bound is not None:
+                conditions.append(condition)
+                params.append(format_timestamp(bound))
+        query = 'SELECT position, {} FROM entries WHERE {} ORDER BY position LIMIT {}'.format(
+            ', '.join(RegistryEntry.FIELDS), ' AND '.join(conditions), self.PAGE_SIZE)
+        position = 0
+        while True:
+            rows = self._connection().execute(query, [position] + params).fetchall()
+            for row in rows:
+                yield RegistryEntry(*row[1:])
+            if len(rows) < self.PAGE_SIZE:
+                return
+            position = rows[-1][0]
+
+    def get_all_entries(self):
+        return self._select()
+
+    def find_by_name(self, name):
+        entries = self._select('WHERE name = ?', (name,))
+        return entries[0] if entries else None
+
+    def find_by_status(self, status):
+        return self._select('WHERE status = ?', (status,))
+
+    def find_by_digest(self, digest):
+        return self._select('WHERE digest = ?', (digest,))
+
+    def add_entry(self, name, status, address, timestamp, **fields):
+        entry = RegistryEntry(name=name, status=status,
+                              address=address, timestamp=timestamp, **fields)
+        try:
+            with self._transaction() as conn:
+                self._insert(conn, [entry])
+        except sqlite3.IntegrityError:
+            raise ValueError("Cannot add '{}' to registry; it is already there.".format(name))
+        return entry
+
+    def _insert(self, conn, entries):
+        conn.executemany('INSERT INTO entries ({}) VALUES ({})'.format(
+            ', '.join(RegistryEntry.FIELDS), ', '.join('?' * len(RegistryEntry.FIELDS))),
+            [[getattr(entry, field) for field in RegistryEntry.FIELDS] for entry in entries])
+
+    def update_entry(self, name, **changes):
+        """
+        Replace fields of an existing entry in place. Returns the new entry.
+        """
+        return self.update_entries({name: changes})[name]
+
+    def update_entries(self, changes):
+        """
+        Apply several in-place updates in a single transaction.
+
+        Parameters
+        ----------
+        changes : dict
+            Maps each name to a dict of the fields to change for that entry.
+
+        Returns a dict mapping each name to its new entry.
+        """
+        updated = {}
+        with self._transaction() as conn:
+            for name, fields in changes.items():
+                row = conn.execute('SELECT {} FROM entries WHERE name = ?'.format(
+                    ', '.join(RegistryEntry.FIELDS)), (name,)).fetchone()
+                if row is None:
+                    raise ValueError("Cannot update '{}' in registry; it is not there.".format(name))
+                updated[name] = RegistryEntry(*row).replace(**fields)
+            conn.executemany('UPDATE entries SET {} WHERE name = ?'.format(
+                ', '.join('{} = ?'.format(field) for field in RegistryEntry.FIELDS)),
+                [[getattr(entry, field) for field in RegistryEntry.FIELDS] + [name]
+                 for name, entry in updated.items()])
+        return updated
+
+    def put_entries(self, entries):
+        """
+        Add several entries in a single transaction. An entry whose name is
+        already registered replaces the existing one in place.
+        """
+        fields = RegistryEntry.FIELDS
+        with self._transaction() as conn:
+            conn.executemany('INSERT INTO entries ({}) VALUES ({}) ON CONFLICT (name) DO UPDATE SET {}'.format(
+                ', '.join(fields), ', '.join('?' * len(fields)),
+                ', '.join('{0} = excluded.{0}'.format(field) for field in fields[1:])),
+                [[getattr(entry, field) for field in fields] for entry in entries])
+
+    def remove_entry(self, name):
+        with self._transaction() as conn:
+            removed_entry = self.find_by_name(name)
+            if not removed_entry:
+                raise ValueError("Cannot remove '{}' from registry; it is not there.".format(name))
+            conn.execute('DELETE FROM entries WHERE name = ?', (name,))
+        return removed_entry
+
+    def remove_entries(self, names):
+        """
+        Remove several entries in a single transaction. Returns the removed
+        entries.
+        """
+        removed = []
+        with self._transaction() as conn:
+            for name in dict.fromkeys(names):
+                removed_entry = self.find_by_name(name)
+                if not removed_entry:
+                    raise ValueError("Cannot remove '{}' from registry; it is not there.".format(name))
+                removed.append(removed_entry)
+            conn.executemany('DELETE FROM entries WHERE name = ?', [(entry.name,) for entry in removed])
+        return removed
+
+    def import_tsv(self, tsv_file=None):
+        """
+        Replace the contents of the database with those of a TSV registry.
+        """
+        with self._transaction() as conn:
+            self._import(conn, tsv_file or self.tsv_file)
+
+    def _import(self, conn, tsv_file):
+        with open(tsv_file, 'r', newline='') as f:
+            reader = csv.reader(f, delimiter=DELIMITER, quotechar=QUOTECHAR)
+            entries = [RegistryEntry(*row) for row in reader if row]
+        conn.execute('DELETE FROM entries')
+        self._insert(conn, entries)
+
+    def export_tsv(self, tsv_file=None):
+        """
+        Write the contents of the database to a TSV registry (by default the
+        one it was imported from), e.g. before checking it into git.
+        """
+        with atomic_path(tsv_file or self.tsv_file) as tmp_file:
+            with open(tmp_file, 'w', newline='') as f:
+                writer = csv.writer(f, delimiter=DELIMITER, quotechar=QUOTECHAR)
+                for entry in self.iter_entries():
+                    writer.writerow(entry.to_list())
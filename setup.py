@@ -10,4 +10,11 @@ setup(
         "dill",
         "boto3"
         ],
+    extras_require={
+        "zstd": ["zstandard"],
+        "lz4": ["lz4"],
+        "chunking": ["numpy"],
+        "xxhash": ["xxhash"],
+        "blake3": ["blake3"],
+        },
     )
@@ -1,9 +1,20 @@
-from model_filer import Filer
+from model_filer import (AsyncFiler, DigestMismatchError, Filer, MetricsAggregator, ObjectCache,
+                         SQLiteRegistry, TransferError, register_remote_type)
+from model_filer.metrics import Event
+from model_filer.registry import Registry, RegistryEntry
+from model_filer.remotes import DriveRemote
 
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from pickle import PickleBuffer
 from pytest import raises
 import shutil
 import os
+import subprocess
 import sys
+import threading
 
 # SET UP
 # make temporary directories here.
@@ -148,6 +159,553 @@ try:
     fl.show_files()
     # At the end of this there should still be an orphaned dummy1 that is not in the registry.
 
+    # Test registry indexing ##########################################
+    # a second filer's writes should be picked up by the first
+    fl2 = Filer(local_dir, remote_dir)
+    fl2.dump(dummy_object, 'dummy3')
+    assert fl.registry.find_by_name('dummy3').status == 'local'
+    # pushing updates the entry in place rather than moving it to the end
+    fl.push('dummy3')
+    names = [entry.name for entry in fl2.registry.get_all_entries()]
+    assert names == ['dummy2', 'dummy3']
+    assert fl2.registry.find_by_name('dummy3').status == 'synced'
+    fl.remove('dummy3', remove_remote=True)
+    assert fl2.registry.find_by_name('dummy3') is None
+
+    # Test concurrent batch transfers #################################
+    fl = Filer(local_dir, remote_dir, max_workers=4)
+    for i in range(8):
+        fl.dump(dummy_object, 'batch{}'.format(i))
+    fl.push_all()
+    for i in range(8):
+        assert fl.registry.find_by_name('batch{}'.format(i)).status == 'synced'
+        os.remove(os.path.join(local_dir, 'batch{}.pkl'.format(i)))
+    # one bad name should not stop the others from being pulled
+    with raises(TransferError) as excinfo:
+        fl.pull_many(['batch0', 'badobjectname', 'batch1'])
+    assert list(excinfo.value.errors) == ['badobjectname']
+    assert os.path.isfile(os.path.join(local_dir, 'batch1.pkl'))
+    fl.pull_all(max_workers=2)
+    for i in range(8):
+        assert fl.load('batch{}'.format(i)) == dummy_object
+        fl.remove('batch{}'.format(i), remove_remote=True)
+
+    # Test compression codecs #########################################
+    big_object = ['hello!'] * 10000
+    fl = Filer(local_dir, remote_dir, codec='gzip')
+    fl.dump(big_object, 'compressed1', push=True)
+    fl.dump(big_object, 'compressed2', codec='lzma')
+    fl.dump(big_object, 'plain', codec='none')
+    assert fl.registry.find_by_name('compressed1').codec == 'gzip'
+    assert fl.registry.find_by_name('compressed2').codec == 'lzma'
+    assert fl.registry.find_by_name('plain').codec is None
+    assert (os.path.getsize(os.path.join(local_dir, 'compressed1.pkl')) <
+            os.path.getsize(os.path.join(local_dir, 'plain.pkl')))
+    # a filer without a default codec still decodes using the registry
+    fl = Filer(local_dir, remote_dir)
+    os.remove(os.path.join(local_dir, 'compressed1.pkl'))
+    for name in ('compressed1', 'compressed2', 'plain'):
+        assert fl.load(name) == big_object
+        fl.remove(name, remove_remote=True)
+    with raises(ValueError):
+        Filer(local_dir, remote_dir, codec='foo')
+
+    # Test content addressing #########################################
+    fl = Filer(local_dir, remote_dir, content_addressed=True)
+    n_remote = len(os.listdir(remote_dir))
+    fl.dump(dummy_object, 'same1', push=True)
+    fl.dump(dummy_object, 'same2', push=True)
+    entry1 = fl.registry.find_by_name('same1')
+    entry2 = fl.registry.find_by_name('same2')
+    assert entry1.digest == entry2.digest
+    assert entry1.address == entry2.address
+    assert {'same1', 'same2'} <= set(entry.name for entry in fl.registry.find_by_digest(entry1.digest))
+    assert len(os.listdir(remote_dir)) == n_remote + 1  # uploaded only once
+    # a local file with the same digest is reused instead of downloading
+    os.remove(os.path.join(local_dir, 'same2.pkl'))
+    os.rename(entry1.address, entry1.address + '.moved')
+    fl.pull('same2')
+    assert fl.load('same2') == dummy_object
+    os.rename(entry1.address + '.moved', entry1.address)
+    # (a corrupt duplicate is not copied; the file is downloaded instead)
+    with open(os.path.join(local_dir, 'same1.pkl'), 'ab') as f:
+        f.write(b'corrupt')
+    os.remove(os.path.join(local_dir, 'same2.pkl'))
+    fl.pull('same2')
+    assert fl.load('same2') == dummy_object
+    assert not [f for f in os.listdir(local_dir) if f.endswith('.tmp')]
+    os.remove(os.path.join(local_dir, 'same1.pkl'))
+    # a shared remote object is kept until its last reference is removed
+    fl.remove('same1', remove_remote=True)
+    assert os.path.isfile(entry1.address)
+    fl.remove('same2', remove_remote=True)
+    assert not os.path.isfile(entry1.address)
+
+    # Test object cache ###############################################
+    fl = Filer(local_dir, remote_dir, cache=10 ** 6)
+    fl.dump(['hello!'], 'cached')
+    first = fl.load('cached')
+    assert fl.load('cached') is first
+    assert fl.cache.stats()['hits'] == 1
+    # overwriting invalidates the cached object
+    fl.dump(['goodbye!'], 'cached', overwrite=True)
+    assert fl.load('cached') == ['goodbye!']
+    # so does a change made by another filer
+    Filer(local_dir, remote_dir).dump(['again!'], 'cached', overwrite=True)
+    assert fl.load('cached') == ['again!']
+    fl.remove('cached')
+    assert fl.cache.stats()['items'] == 0
+    # objects are evicted least recently used first
+    cache = ObjectCache(max_bytes=100)
+    cache.put('a', 1, 'A', 40)
+    cache.put('b', 1, 'B', 40)
+    cache.get('a', 1)
+    cache.put('c', 1, 'C', 40)
+    assert cache.get('b', 1) is None
+    assert cache.get('a', 1) == 'A' and cache.get('c', 1) == 'C'
+    assert cache.get('a', 2) is None  # stale version
+
+    # Test out-of-band buffers ########################################
+    payload = bytearray(b'0123456789abcdef' * 2 ** 14)
+    fl = Filer(local_dir, remote_dir, codec='gzip')
+    fl.dump({'data': PickleBuffer(payload), 'meta': 'hello!'}, 'oob', out_of_band=True, push=True)
+    assert fl.registry.find_by_name('oob').layout == 'oob'
+    assert os.path.isfile(os.path.join(local_dir, 'oob.buf'))
+    assert os.path.getsize(os.path.join(local_dir, 'oob.pkl')) < 1000
+    # the buffer comes back as a read-only view into the memory-mapped file
+    loaded = fl.load('oob')
+    assert loaded['meta'] == 'hello!'
+    assert loaded['data'].readonly and bytes(loaded['data']) == payload
+    # both files are pulled if either is missing
+    del loaded
+    os.remove(os.path.join(local_dir, 'oob.buf'))
+    fl.pull_all()
+    assert bytes(fl.load('oob')['data']) == payload
+    fl.remove('oob', remove_remote=True)
+
+    # Test verified, resumable downloads ##############################
+    fl = Filer(local_dir, remote_dir)
+    fl.dump(big_object, 'verified', push=True)
+    local_file = os.path.join(local_dir, 'verified.pkl')
+    address = fl.registry.find_by_name('verified').address
+    with open(address, 'rb') as f:
+        remote_bytes = f.read()
+    # an interrupted download is resumed from its part file
+    os.remove(local_file)
+    with open(local_file + '.part', 'wb') as f:
+        f.write(remote_bytes[:100])
+    assert fl.load('verified') == big_object
+    assert not os.path.exists(local_file + '.part')
+    # a part file that doesn't match is thrown away and downloaded again
+    os.remove(local_file)
+    with open(local_file + '.part', 'wb') as f:
+        f.write(b'garbage')
+    fl.pull('verified')
+    assert fl.load('verified') == big_object
+    # a corrupted remote file never makes it into the local directory
+    os.remove(local_file)
+    with open(address, 'wb') as f:
+        f.write(remote_bytes[:-1] + b'!')
+    with raises(DigestMismatchError):
+        fl.pull('verified')
+    assert not os.path.exists(local_file)
+    assert not os.path.exists(local_file + '.part')
+    fl.remove('verified', remove_remote=True)
+
+    # Test metrics ####################################################
+    metrics = MetricsAggregator()
+    events = []
+    fl = Filer(local_dir, remote_dir, codec='gzip', metrics=[metrics, events.append])
+    fl.dump(big_object, 'measured', push=True)
+    os.remove(os.path.join(local_dir, 'measured.pkl'))
+    fl.load('measured')
+    summary = metrics.summary()
+    for phase in ('registry', 'serialize', 'write', 'upload', 'download', 'read', 'deserialize'):
+        assert summary[phase]['count'] >= 1
+        assert summary[phase]['p50'] <= summary[phase]['p99']
+    assert all(event.name == 'measured' for event in events)
+    stored_size = os.path.getsize(os.path.join(local_dir, 'measured.pkl'))
+    assert summary['download']['total_bytes'] == stored_size
+    assert summary['read']['total_bytes'] == stored_size
+    fl.remove('measured', remove_remote=True)
+    # (only a bounded sample of durations is kept)
+    metrics = MetricsAggregator(sample_size=10)
+    for i in range(1000):
+        metrics(Event('phase', 'name', i / 1000, None, i % 2 == 0))
+    summary = metrics.summary()['phase']
+    assert (summary['count'], summary['errors'], summary['min'], summary['max']) == (1000, 500, 0, 0.999)
+    assert len(metrics._phases['phase'].sample) == 10
+    assert 0 <= summary['p50'] <= summary['p99'] <= 0.999
+
+    # Test sqlite registry ####################################################
+    fl = Filer(local_dir, remote_dir)
+    fl.dump(dummy_object, 'from_tsv', push=True)
+    fl = Filer(local_dir, remote_dir, registry_backend='sqlite')
+    assert fl.registry.find_by_name('from_tsv').status == 'synced'
+    assert fl.load('from_tsv') == dummy_object
+    db_file = fl.registry.db_file
+
+    # separate instances stand in for separate processes
+    def add_concurrently(i):
+        SQLiteRegistry(db_file).add_entry('concurrent{}'.format(i), 'local', None,
+                                          '2020-01-01::00:00:00')
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(add_concurrently, range(32)))
+    assert len(fl.registry.find_by_status('local')) == 32
+    with raises(ValueError):
+        fl.registry.add_entry('concurrent0', 'local', None, '2020-01-01::00:00:00')
+    for i in range(32):
+        fl.registry.remove_entry('concurrent{}'.format(i))
+    # (the TSV registry only seeds the database once, even if it is emptied)
+    seeded_file = os.path.join(local_dir, '.seeded_registry')
+    Registry(seeded_file).add_entry('seed', 'local', None, '2020-01-01::00:00:00')
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        seeded = list(executor.map(lambda _: SQLiteRegistry(seeded_file + '.sqlite', seeded_file),
+                                   range(4)))
+    seeded[0].add_entry('added', 'local', None, '2020-01-01::00:00:00')
+    assert [entry.name for entry in SQLiteRegistry(seeded_file + '.sqlite', seeded_file).get_all_entries()] == \
+        ['seed', 'added']
+    seeded[0].remove_entries(['seed', 'added'])
+    assert SQLiteRegistry(seeded_file + '.sqlite', seeded_file).get_all_entries() == []
+
+    fl.dump(dummy_object, 'from_sqlite')
+    fl.registry.export_tsv()
+    assert Filer(local_dir, remote_dir).load('from_sqlite') == dummy_object
+    fl.remove('from_sqlite')
+    fl.remove('from_tsv', remove_remote=True)
+    with raises(ValueError):
+        Filer(local_dir, remote_dir, registry_backend='csv')
+
+    # Test asyncio api ####################################################
+    events = []
+    afl = AsyncFiler(Filer(local_dir, remote_dir, max_workers=4, metrics=events.append))
+    for i in range(3):
+        afl.filer.dump(big_object + [i], 'async{}'.format(i))
+    asyncio.run(afl.apush_all())
+    assert all(entry.status == 'synced' for entry in afl.filer.registry.get_all_entries())
+    os.remove(os.path.join(local_dir, 'async0.pkl'))
+
+    async def load_concurrently():
+        return await asyncio.gather(*[afl.aload('async0') for _ in range(10)])
+    loaded = asyncio.run(load_concurrently())
+    assert loaded[0] == big_object + [0]
+    assert all(obj is loaded[0] for obj in loaded)
+    assert [event.phase for event in events].count('download') == 1
+    assert [event.phase for event in events].count('deserialize') == 1
+    for i in range(3):
+        os.remove(os.path.join(local_dir, 'async{}.pkl'.format(i)))
+    asyncio.run(afl.apull_many(['async{}'.format(i) for i in range(3)]))
+    assert all(os.path.isfile(os.path.join(local_dir, 'async{}.pkl'.format(i))) for i in range(3))
+    with raises(TransferError):
+        asyncio.run(afl.apull_many(['missing']))
+    for i in range(3):
+        afl.filer.remove('async{}'.format(i), remove_remote=True)
+
+    # Test local disk quota ####################################################
+    fl = Filer(local_dir, remote_dir)
+    fl.dump(big_object, 'sized')
+    size = os.path.getsize(os.path.join(local_dir, 'sized.pkl'))
+    fl.remove('sized')
+    fl = Filer(local_dir, remote_dir, max_local_bytes=int(2.5 * size))
+    quota_files = [os.path.join(local_dir, 'quota{}.pkl'.format(i)) for i in range(3)]
+    for i in range(3):
+        fl.dump(big_object + [i], 'quota{}'.format(i))
+    # (unpushed files cannot be evicted, even over the quota)
+    assert all(os.path.isfile(f) for f in quota_files)
+    fl.push_all()
+    assert [os.path.isfile(f) for f in quota_files] == [False, True, True]
+    fl.load('quota1')
+    assert fl.load('quota0') == big_object + [0]
+    assert [os.path.isfile(f) for f in quota_files] == [True, True, False]
+    assert fl.evict(max_bytes=0) == ['quota1', 'quota0']
+    with raises(ValueError):
+        Filer(local_dir, remote_dir).evict()
+    for i in range(3):
+        fl.remove('quota{}'.format(i), remove_remote=True)
+
+    # Test prefetch and warm ####################################################
+    events = []
+    fl = Filer(local_dir, remote_dir, max_workers=2, metrics=events.append)
+    names = ['prefetched{}'.format(i) for i in range(4)]
+    for i, name in enumerate(names):
+        fl.dump(big_object + [i], name, push=True)
+        os.remove(os.path.join(local_dir, name + '.pkl'))
+    futures = fl.prefetch(names)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(fl.pull, names * 3))
+    assert all(future.result() is None for future in futures.values())
+    assert [event.phase for event in events].count('download') == 4
+    for name in names:
+        os.remove(os.path.join(local_dir, name + '.pkl'))
+    fl = Filer(local_dir, remote_dir, cache=10 ** 7, warm_set=names)
+    assert fl.warm_futures['prefetched1'].result() == big_object + [1]
+    assert fl.load('prefetched1') is fl.warm_futures['prefetched1'].result()
+    assert fl.cache.stats()['hits'] == 1
+    with raises(ValueError):
+        fl.prefetch(['missing'])['missing'].result()
+    for name in names:
+        fl.remove(name, remove_remote=True)
+
+    # Test streaming dump ####################################################
+    fl = Filer(local_dir, remote_dir)
+    n_remote = len(os.listdir(remote_dir))
+    fl.dump(big_object, 'streamed', stream=True)
+    assert not os.path.exists(os.path.join(local_dir, 'streamed.pkl'))
+    assert fl.registry.find_by_name('streamed').status == 'synced'
+    assert len(os.listdir(remote_dir)) == n_remote + 1
+    assert fl.load('streamed') == big_object
+    # a failed dump leaves nothing behind
+    with raises(TypeError):
+        fl.dump([big_object, (i for i in [])], 'unpicklable', stream=True)
+    assert fl.registry.find_by_name('unpicklable') is None
+    assert len(os.listdir(remote_dir)) == n_remote + 1
+    fl.remove('streamed', remove_remote=True)
+
+    # Test sharded dump ####################################################
+    events = []
+    fl = Filer(local_dir, remote_dir, codec='gzip', metrics=events.append)
+    pipeline = {'vectorizer': big_object, 'classifier': 'hello!', 3: [1, 2, 3]}
+    fl.dump(pipeline, 'pipeline', sharded=True, push=True)
+    with raises(TypeError):
+        fl.dump(big_object, 'not_a_mapping', sharded=True)
+    shard_files = [os.path.join(local_dir, 'pipeline.shard{}'.format(i)) for i in range(3)]
+    for local_file in shard_files + [os.path.join(local_dir, 'pipeline.pkl')]:
+        os.remove(local_file)
+    del events[:]
+    composite = fl.load('pipeline')
+    assert sorted(composite, key=str) == sorted(pipeline, key=str) and 3 in composite
+    assert [event.phase for event in events].count('download') == 1  # just the manifest
+    assert composite['classifier'] == 'hello!'
+    assert [os.path.isfile(f) for f in shard_files] == [False, True, False]
+    assert composite.loaded_keys() == ['classifier']
+    assert dict(composite) == pipeline
+    fl.pull('pipeline')
+    assert all(os.path.isfile(f) for f in shard_files)
+    # (a corrupted shard is caught against the manifest)
+    os.remove(shard_files[0])
+    with open(os.path.join(remote_dir, fl.registry.find_by_name('pipeline').address + '.shard0'), 'ab') as f:
+        f.write(b'junk')
+    with raises(DigestMismatchError):
+        Filer(local_dir, remote_dir).load('pipeline')['vectorizer']
+    # (with an object cache, each component is cached at the size of its shard)
+    cached_fl = Filer(local_dir, remote_dir, cache=10 ** 6)
+    classifier = cached_fl.load('pipeline')['classifier']
+    assert cached_fl.load('pipeline')['classifier'] is classifier
+    assert cached_fl.cache.stats()['items'] == 2
+    cached_fl.cache.clear()
+    cached_fl.load('pipeline')
+    assert cached_fl.cache.stats()['items'] == 1
+    cached_fl.remove('pipeline', remove_remote=True)
+    assert cached_fl.cache.stats()['items'] == 0
+
+    # Test shared cache ####################################################
+    shared_dir = os.path.join(local_dir, 'shared')
+    worker_dirs = [os.path.join(local_dir, 'worker{}'.format(i)) for i in range(4)]
+    for directory in [shared_dir] + worker_dirs:
+        os.makedirs(directory)
+    fl = Filer(local_dir, remote_dir)
+    fl.dump(big_object, 'shared_model', push=True)
+    for directory in worker_dirs:
+        shutil.copy(os.path.join(local_dir, '.drive_registry'), directory)
+    events = []
+    workers = [Filer(directory, remote_dir, shared_cache=shared_dir, metrics=events.append)
+               for directory in worker_dirs]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        loaded = list(executor.map(lambda worker: worker.load('shared_model'), workers))
+    assert all(obj == big_object for obj in loaded)
+    assert [event.phase for event in events].count('download') == 1
+    inodes = {os.stat(os.path.join(directory, 'shared_model.pkl')).st_ino for directory in worker_dirs}
+    assert len(inodes) == 1
+    # a corrupt link (and so the cached file) is downloaded again
+    worker_file = os.path.join(worker_dirs[0], 'shared_model.pkl')
+    with open(worker_file, 'r+b') as f:
+        f.seek(os.path.getsize(worker_file) // 2)
+        f.write(b'corrupt')
+    fresh = Filer(worker_dirs[1], remote_dir, shared_cache=shared_dir)
+    assert fresh.load('shared_model') == big_object
+    assert workers[0].load('shared_model') == big_object
+    assert os.stat(worker_file).st_ino == os.stat(os.path.join(worker_dirs[1], 'shared_model.pkl')).st_ino
+    with raises(FileNotFoundError):
+        Filer(local_dir, remote_dir, shared_cache=os.path.join(local_dir, 'missing'))
+    fl.remove('shared_model', remove_remote=True)
+
+    # Test dump_many ####################################################
+    events = []
+    fl = Filer(local_dir, remote_dir, codec='gzip', metrics=events.append)
+    objs = {'batch{}'.format(i): big_object + [i] for i in range(4)}
+    fl.dump_many(objs, push=True)
+    assert all(fl.registry.find_by_name(name).status == 'synced' for name in objs)
+    assert all(fl.load(name) == obj for name, obj in objs.items())
+    # (the files are not hashed again to verify them)
+    assert not [event for event in events if event.phase == 'verify']
+    with raises(ValueError):
+        fl.dump_many({'batch0': 'again'})
+    # (a failed object does not stop the others, and the fallback runs on threads)
+    with raises(TransferError) as excinfo:
+        fl.dump_many({'batch_new': 'fine', 'batch_bad': (i for i in [])}, processes=False)
+    assert list(excinfo.value.errors) == ['batch_bad']
+    assert fl.load('batch_new') == 'fine'
+    assert fl.registry.find_by_name('batch_bad') is None
+    for name in list(objs) + ['batch_new']:
+        fl.remove(name, remove_remote=True)
+    # (with other threads running, objects are serialized on threads, not forked)
+    release = threading.Event()
+    other_thread = threading.Thread(target=release.wait)
+    other_thread.start()
+    try:
+        del events[:]
+        fl.dump_many({'threaded1': 'a', 'threaded2': 'b'}, max_workers=2)
+        assert [event.phase for event in events].count('serialize') == 2
+    finally:
+        release.set()
+        other_thread.join()
+    fl.remove_many(['threaded1', 'threaded2'])
+
+    # Test chunked storage ##############################################
+    fl = Filer(local_dir, remote_dir, chunked=True, max_workers=4)
+    before = set(os.listdir(remote_dir))
+    version_1 = bytearray(os.urandom(8 * 2 ** 20))
+    fl.dump(bytes(version_1), 'chunked1', push=True)
+    chunks_1 = set(f for f in os.listdir(remote_dir) if f.endswith('.chunk'))
+    assert len(chunks_1) > 2
+    # (a small edit only uploads the chunks around it)
+    version_1[2 ** 22:2 ** 22 + 100] = os.urandom(100)
+    fl.dump(bytes(version_1), 'chunked2', push=True)
+    chunks_2 = set(f for f in os.listdir(remote_dir) if f.endswith('.chunk')) - chunks_1
+    assert 1 <= len(chunks_2) <= 2
+    fl.evict(0)
+    assert fl.load('chunked1')[:100] == bytes(version_1[:100])
+    stored = set(os.listdir(os.path.join(local_dir, '.chunks')))
+    assert fl.load('chunked2') == bytes(version_1)
+    assert len(set(os.listdir(os.path.join(local_dir, '.chunks'))) - stored) == len(chunks_2)
+    # (chunks count towards the quota, and go before the files)
+    size = os.path.getsize(os.path.join(local_dir, 'chunked2.pkl'))
+    assert Filer(local_dir, remote_dir).evict(2 * size + 2 ** 20) == []
+    chunk_dir = os.path.join(local_dir, '.chunks')
+    assert sum(os.path.getsize(os.path.join(chunk_dir, f)) for f in os.listdir(chunk_dir)) <= 2 ** 20
+    fl.evict(0)
+    quota_fl = Filer(local_dir, remote_dir, chunked=True, max_local_bytes=size + 2 ** 20)
+    assert quota_fl.load('chunked2') == bytes(version_1)
+    usage = sum(os.path.getsize(os.path.join(local_dir, '.chunks', f))
+                for f in os.listdir(os.path.join(local_dir, '.chunks')))
+    assert usage + size <= size + 2 ** 20
+    for name in ['chunked1', 'chunked2']:
+        fl.remove(name, remove_remote=True)
+    for f in set(os.listdir(remote_dir)) - before:
+        os.remove(os.path.join(remote_dir, f))
+    shutil.rmtree(os.path.join(local_dir, '.chunks'))
+
+    # Test status and bulk removal ######################################
+    fl = Filer(local_dir, remote_dir)
+    for name in ['bulk1', 'bulk2', 'bulk3']:
+        fl.dump(dummy_object, name, push=True)
+    fl.dump(dummy_object, 'bulk_local')
+    os.remove(fl._get_local_filename('bulk1'))
+    os.remove(fl.registry.find_by_name('bulk2').address)
+    report = fl.status()
+    assert report['bulk1'] == {'status': 'synced', 'local': False, 'remote': True}
+    assert report['bulk2'] == {'status': 'synced', 'local': True, 'remote': False}
+    assert report['bulk_local'] == {'status': 'local', 'local': True, 'remote': None}
+    # (removing without the remote leaves an orphan behind)
+    orphan = fl.registry.find_by_name('bulk3').address
+    fl.remove('bulk3')
+    assert orphan in fl.find_orphans(min_age=0)
+    assert orphan not in fl.find_orphans()
+    # (by default only a dry run, and the drive remote has no prefix of its own)
+    assert orphan in fl.collect_garbage(min_age=0)
+    assert os.path.exists(orphan)
+    with raises(ValueError):
+        fl.collect_garbage(min_age=0, dry_run=False)
+    assert orphan in fl.collect_garbage(min_age=0, dry_run=False, exclusive=True)
+    assert not os.path.exists(orphan)
+    address = fl.registry.find_by_name('bulk1').address
+    with raises(ValueError):
+        fl.remove_many(['bulk1', 'missing'])
+    fl.remove_many(['bulk1', 'bulk2', 'bulk_local'], remove_remote=True)
+    assert fl.registry.find_by_name('bulk1') is None
+    assert not os.path.exists(address)
+
+    # Test remote types and lazy imports ################################
+    # (boto3 is only imported, and the client only created, when needed)
+    subprocess.run([sys.executable, '-c', "import sys, model_filer; assert 'boto3' not in sys.modules"],
+                   check=True, env=dict(os.environ, PYTHONPATH=os.path.dirname(here)))
+    assert Filer(local_dir, remote_type='s3').remote._s3_client is None
+    # (the remotes can still be imported from where they used to be)
+    subprocess.run([sys.executable, '-c', "import sys, model_filer; model_filer.DriveRemote; "
+                    "assert 'boto3' not in sys.modules; "
+                    "from model_filer.remotes import S3Remote, get_s3_client; "
+                    "from model_filer.filer import S3Remote as FilerS3Remote; "
+                    "assert model_filer.S3Remote is S3Remote is FilerS3Remote"],
+                   check=True, env=dict(os.environ, PYTHONPATH=os.path.dirname(here)))
+
+    class OtherDrive(DriveRemote):
+        pass
+    register_remote_type('other_drive', OtherDrive)
+    fl = Filer(local_dir, remote_dir, remote_type='other_drive')
+    assert isinstance(fl.remote, OtherDrive)
+    fl.dump(dummy_object, 'other1')
+    assert os.path.isfile(os.path.join(local_dir, '.other_drive_registry'))
+    fl.remove('other1')
+
+    # Test filtered registry iteration #################################
+    registries = [Registry(os.path.join(local_dir, '.filter_registry')),
+                  SQLiteRegistry(os.path.join(local_dir, '.filter_registry.sqlite'))]
+    # (several pages of rows)
+    registries[1].PAGE_SIZE = 3
+    for registry in registries:
+        registry.put_entries([
+            RegistryEntry('team_a/model{}'.format(i), 'synced' if i % 2 else 'local', None,
+                          '2020-01-0{}::00:00:00'.format(i + 1)) for i in range(8)]
+            + [RegistryEntry('team_b/model', 'local', None, '2021-01-01::00:00:00')])
+        entries = registry.iter_entries()
+        assert next(entries).name == 'team_a/model0'
+        assert len(list(entries)) == 8
+        assert [entry.name for entry in registry.iter_entries(status='synced')] == \
+            ['team_a/model{}'.format(i) for i in (1, 3, 5, 7)]
+        assert len(list(registry.iter_entries(prefix='team_a/'))) == 8
+        assert [entry.name for entry in registry.iter_entries(prefix='team_b')] == ['team_b/model']
+        assert not list(registry.iter_entries(prefix='team_c'))
+        in_range = registry.iter_entries(status='local', since='2020-01-03::00:00:00',
+                                         until=datetime(2020, 1, 7))
+        assert [entry.name for entry in in_range] == ['team_a/model2', 'team_a/model4']
+        # (the iteration is not affected by changes made during it)
+        for entry in registry.iter_entries(status='local'):
+            registry.remove_entry(entry.name)
+        assert len(registry.get_all_entries()) == 4
+    with raises(AttributeError):
+        registries[0].find_by_name('team_a/model1').extra = 1
+
+    # Test verification on load #########################################
+    events = []
+    fl = Filer(local_dir, remote_dir, metrics=events.append)
+    fl.dump(big_object, 'verify1', push=True)
+    fl.evict(0)
+    assert fl.load('verify1') == big_object
+    # (files hashed as they were dumped or pulled are not hashed again)
+    assert fl.load('verify1') == big_object
+    assert not [event for event in events if event.phase == 'verify']
+    local_file = os.path.join(local_dir, 'verify1.pkl')
+    size = os.path.getsize(local_file)
+    with open(local_file, 'r+b') as f:
+        f.seek(size // 2)
+        f.write(b'corrupt')
+    assert fl.verify_all() == ['verify1']
+    # a corrupt copy of a synced file is pulled again
+    assert fl.load('verify1') == big_object
+    assert fl.verify_all() == []
+    fl.dump(big_object, 'verify2', codec='none')
+    with open(os.path.join(local_dir, 'verify2.pkl'), 'ab') as f:
+        f.write(b'corrupt')
+    with raises(DigestMismatchError):
+        fl.load('verify2')
+    assert Filer(local_dir, remote_dir, verify=False).load('verify2') == big_object
+    fl = Filer(local_dir, remote_dir, digest_algorithm='blake2b')
+    fl.dump(dummy_object, 'verify3')
+    assert fl.registry.find_by_name('verify3').digest.startswith('blake2b:')
+    assert fl.load('verify3') == dummy_object
+    for name in ['verify1', 'verify2', 'verify3']:
+        fl.remove(name, remove_remote=True)
+
 except:
     # tear down
     shutil.rmtree(local_dir)
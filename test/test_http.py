@@ -0,0 +1,166 @@
+"""
+Tests of the HTTP remote, against a local server that serves the drive
+remote's directory with keep-alive connections, ranges and ETags.
+"""
+
+from model_filer import Filer
+
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pytest import raises
+import hashlib
+import os
+import shutil
+import threading
+
+# SET UP
+# make temporary directories here.
+here = os.path.dirname(os.path.realpath(__file__))
+local_dir = os.path.join(here, 'local')
+os.makedirs(local_dir)
+remote_dir = os.path.join(here, 'remote')
+os.makedirs(remote_dir)
+
+
+class Handler(SimpleHTTPRequestHandler):
+    """
+    Serves files with the headers an artifact server or CDN would send, and
+    counts connections and responses.
+    """
+    protocol_version = 'HTTP/1.1'
+    connections = 0
+    statuses = []
+    # (set to fail the ranges fetched after the first one)
+    fail_ranges = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, directory=remote_dir, **kwargs)
+
+    def setup(self):
+        super().setup()
+        Handler.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def send_response(self, code, message=None):
+        Handler.statuses.append(code)
+        super().send_response(code, message)
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return None
+        stat = os.stat(path)
+        etag = '"{}-{}"'.format(stat.st_size, stat.st_mtime_ns)
+        if Handler.fail_ranges and 'If-Match' in self.headers:
+            self.send_error(503)
+            return None
+        if self.headers.get('If-Match', etag) != etag:
+            self.send_error(412)
+            return None
+        start, end = 0, stat.st_size
+        partial = ('Range' in self.headers
+                   and self.headers.get('If-Range', etag) == etag)
+        if partial:
+            first, _, last = self.headers['Range'][len('bytes='):].partition('-')
+            start, end = int(first), min(int(last) + 1 if last else end, end)
+            if start >= stat.st_size:
+                self.send_error(416)
+                return None
+        f = open(path, 'rb')
+        f.seek(start)
+        self.send_response(206 if partial else 200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(end - start))
+        if partial:
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, end - 1, stat.st_size))
+        self.end_headers()
+        self._remaining = end - start
+        return f
+
+    def copyfile(self, source, outputfile):
+        outputfile.write(source.read(self._remaining))
+
+
+server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+base_url = 'http://127.0.0.1:{}/'.format(server.server_address[1])
+
+try:
+    # Test pulling through the HTTP remote ############################
+    # (pushed to the drive remote, and pulled over HTTP with its registry)
+    fl = Filer(local_dir, remote_dir)
+    big_object = os.urandom(300000)
+    fl.dump(big_object, 'big', push=True)
+    fl.dump('hello!', 'small', push=True)
+    fl.evict(0)
+    hfl = Filer(local_dir, base_url, remote_type='http', max_workers=4,
+                remote_options={'mirror_of': 'drive', 'part_size': 64 * 1024})
+    assert hfl.load('big') == big_object
+    assert hfl.load('small') == 'hello!'
+    # (the ranges of the big file were fetched on kept-alive connections)
+    assert 206 in Handler.statuses
+    assert Handler.connections < len(Handler.statuses)
+
+    # the remote is read-only
+    hfl.dump('hello!', 'http_local')
+    with raises(NotImplementedError):
+        hfl.push('http_local')
+    hfl.remove('http_local')
+    # (removing remote objects is refused before the registry is changed)
+    with raises(ValueError):
+        hfl.remove('small', remove_remote=True)
+    with raises(ValueError):
+        hfl.remove_many(['small'], remove_remote=True)
+    with raises(ValueError):
+        hfl.collect_garbage(dry_run=False, exclusive=True)
+    # (listing orphans is allowed, but the server cannot be listed)
+    with raises(NotImplementedError):
+        hfl.find_orphans()
+    assert hfl.registry.find_by_name('small')
+    assert hfl.status()['small'] == {'status': 'synced', 'local': True, 'remote': None}
+    address = hfl.registry.find_by_name('big').address
+    assert hfl.remote.exists(address)
+    assert not hfl.remote.exists(address + '.missing')
+    with raises(FileNotFoundError):
+        hfl.remote.download(os.path.join(local_dir, 'missing'), address + '.missing')
+
+    # Test resumed downloads ##########################################
+    remote = hfl.remote
+    target = os.path.join(local_dir, 'target.part')
+    with open(os.path.join(local_dir, 'big.pkl'), 'rb') as f:
+        pickled = f.read()
+    # an interrupted download is resumed while the object is unchanged...
+    Handler.fail_ranges = True
+    with raises(OSError):
+        remote.download(target, address)
+    Handler.fail_ranges = False
+    assert 0 < os.path.getsize(target) < len(pickled)
+    del Handler.statuses[:]
+    assert remote.download(target, address) == 'sha256:' + hashlib.sha256(pickled).hexdigest()
+    assert 200 not in Handler.statuses
+    os.remove(target)
+    # ...and started over once it has changed
+    Handler.fail_ranges = True
+    with raises(OSError):
+        remote.download(target, address)
+    Handler.fail_ranges = False
+    changed = pickled[:500] + b'changed' + pickled[507:]
+    with open(address, 'wb') as f:
+        f.write(changed)
+    assert remote.download(target, address) == 'sha256:' + hashlib.sha256(changed).hexdigest()
+    assert not remote._partial
+    os.remove(target)
+
+except:
+    # tear down
+    server.shutdown()
+    shutil.rmtree(local_dir)
+    shutil.rmtree(remote_dir)
+    raise
+
+# TEAR DOWN
+server.shutdown()
+shutil.rmtree(local_dir)
+shutil.rmtree(remote_dir)
@@ -135,6 +135,19 @@ try:
     fl.show_files()
     # At the end of this there should still be an orphaned dummy1 that is not in the registry.
 
+    # Test transfer settings ##########################################
+    # filers share one client
+    assert Filer(local_dir, remote_type='s3').remote.s3_client is fl.remote.s3_client
+    fl = Filer(local_dir, remote_type='s3',
+               remote_options={'prefix': 'test/', 'transfer_config': {'multipart_chunksize': 2 ** 20,
+                                                                      'max_concurrency': 4}})
+    big_object = os.urandom(5 * 2 ** 20)
+    fl.dump(big_object, 'prefixed', push=True)
+    assert fl.registry.find_by_name('prefixed').address.startswith('test/')
+    os.remove(os.path.join(local_dir, 'prefixed.pkl'))
+    assert fl.load('prefixed') == big_object
+    fl.remove('prefixed', remove_remote=True)
+
 except:
     # tear down
     shutil.rmtree(local_dir)